@@ -0,0 +1,52 @@
+# project/benchmarks/bench_batch.py
+
+import random
+
+from cogs.composition import compute_list_updates
+from loadtest.fake_discord import FakeWorld
+from utils.data_manager import CompositionListData
+from utils.population import build_roster, tracked_roles_by_position
+from utils.role_bitset import RoleBitset
+from utils.role_index import RoleMemberIndex
+
+CHANGED_MEMBERS = 50
+
+
+def _make_lists(guild, count: int, distinct_role_sets: int):
+    """
+    Списки, заполненные текущим составом. Наборы ролей повторяются по кругу:
+    distinct_role_sets=1 - все списки по одним и тем же ролям.
+    """
+    rng = random.Random(guild.id)
+    role_sets = [rng.sample(guild.tracked_roles, len(guild.tracked_roles) - i % 2) for i in range(distinct_role_sets)]
+    lists = []
+    for i in range(count):
+        roles = role_sets[i % distinct_role_sets]
+        sections = {str(role.id): {'header': role.name, 'role_name': role.name, 'position': role.position} for role in roles}
+        roster = build_roster(guild.members, tracked_roles_by_position(guild, sections))
+        lists.append(CompositionListData(i + 1, 1, guild.id, f"Список {i}", sections, roster))
+    return lists
+
+
+def run(suite, quick: bool):
+    # (участников, списков, различных наборов ролей)
+    cases = [(1_000, 1, 1), (10_000, 1, 1)] if quick else [(1_000, 1, 1), (10_000, 1, 1), (10_000, 20, 1), (10_000, 20, 20), (50_000, 5, 1)]
+    for members, list_count, distinct in cases:
+        world = FakeWorld(seed=members)
+        guild = world.build_guild(members, tracked_roles=5, untracked_roles=20)
+        lists = _make_lists(guild, list_count, distinct)
+        role_index = RoleMemberIndex()
+        role_index.build(guild, [role.id for role in guild.tracked_roles])
+        rng = random.Random(members)
+        changed = [member.id for member in rng.sample(guild.members, CHANGED_MEMBERS)]
+
+        def process():
+            # То же, что делает batch_processor для одного сервера после загрузки списков
+            bitset = RoleBitset.compile(guild, {role_id for db_list in lists for role_id in db_list.sections})
+            member_masks = {member_id: bitset.mask_for(role_index.roles_of(guild.id, member_id)) for member_id in changed}
+            compute_list_updates(bitset, lists, member_masks)
+
+        name = f"batch.apply_member_updates[members={members},lists={list_count},changed={CHANGED_MEMBERS}]"
+        if distinct > 1:
+            name = f"batch.apply_member_updates[members={members},lists={list_count},role_sets={distinct},changed={CHANGED_MEMBERS}]"
+        suite.measure(name, process)
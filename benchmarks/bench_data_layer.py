@@ -0,0 +1,84 @@
+# project/benchmarks/bench_data_layer.py
+
+import itertools
+import json
+import os
+import random
+
+from benchmarks.common import WORK_DIR, make_sections, make_users
+from utils import json_column
+from utils.data_manager import DatabaseManager, CompositionList
+
+LISTS_PER_GUILD = 10
+SECTIONS_PER_LIST = 5
+USERS_PER_LIST = 20
+
+
+def _populate(manager: DatabaseManager, count: int, rng: random.Random):
+    """Заполняет базу count списками одним INSERT (подготовка не замеряется)."""
+    rows = []
+    for i in range(1, count + 1):
+        sections = make_sections(rng, SECTIONS_PER_LIST)
+        rows.append({
+            'message_id': i,
+            'channel_id': i % 97 + 1,
+            'guild_id': (i - 1) // LISTS_PER_GUILD + 1,
+            'title': f"Список {i}",
+            'sections': sections,
+            'current_users': make_users(rng, sections, USERS_PER_LIST),
+        })
+    with manager.engine.begin() as connection:
+        connection.execute(CompositionList.__table__.insert(), rows)
+
+
+def bench_crud(suite, sizes):
+    for size in sizes:
+        rng = random.Random(size)
+        path = os.path.join(WORK_DIR, f"crud_{size}.db")
+        manager = DatabaseManager(f"sqlite:///{path}")
+        _populate(manager, size, rng)
+
+        ids = itertools.cycle(rng.sample(range(1, size + 1), min(size, 1000)))
+        guilds = itertools.cycle(rng.sample(range(1, size // LISTS_PER_GUILD + 1), min(size // LISTS_PER_GUILD, 1000)))
+        sections = make_sections(rng, SECTIONS_PER_LIST)
+        new_users = make_users(rng, sections, USERS_PER_LIST)
+        new_ids = itertools.count(size + 1)
+
+        def add_and_delete():
+            message_id = next(new_ids)
+            manager.add_list(message_id, 1, 1, "Новый список", sections)
+            manager.delete_list(message_id)
+
+        suite.measure(f"db.get_list[lists={size}]", lambda: manager.get_list(next(ids)))
+        suite.measure(f"db.get_lists_for_guild[lists={size}]", lambda: manager.get_lists_for_guild(next(guilds)))
+        suite.measure(f"db.update_list_content[lists={size}]", lambda: manager.update_list_content(next(ids), new_users=new_users))
+        suite.measure(f"db.add_delete_list[lists={size}]", add_and_delete)
+        manager.engine.dispose()
+
+
+def bench_json(suite, user_counts):
+    """
+    Стоимость (де)сериализации столбца current_users и его размер в базе:
+    стандартный json (как тип JSON SQLAlchemy) против CompactJSON без сжатия и со сжатием.
+    """
+    rng = random.Random(0)
+    for users in user_counts:
+        sections = make_sections(rng, SECTIONS_PER_LIST)
+        current_users = make_users(rng, sections, users)
+        encoded = json.dumps(current_users)
+        suite.measure(f"json.encode_current_users[users={users}]", lambda: json.dumps(current_users))
+        suite.measure(f"json.decode_current_users[users={users}]", lambda: json.loads(encoded))
+        suite.record_size(f"json.size_current_users[users={users}]", len(encoded.encode('utf-8')))
+
+        # Порог 1 байт - сжимается любое значение
+        for mode, threshold in (('plain', 0), ('zlib', 1)):
+            name = f"compact_json.{json_column.CODEC}.{mode}"
+            blob = json_column.encode(current_users, threshold)
+            suite.measure(f"{name}.encode[users={users}]", lambda threshold=threshold: json_column.encode(current_users, threshold))
+            suite.measure(f"{name}.decode[users={users}]", lambda blob=blob: json_column.decode(blob))
+            suite.record_size(f"{name}.size[users={users}]", len(blob))
+
+
+def run(suite, quick: bool):
+    bench_crud(suite, [1_000] if quick else [1_000, 10_000, 100_000])
+    bench_json(suite, [10, 1_000] if quick else [10, 100, 1_000, 10_000])
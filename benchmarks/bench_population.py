@@ -0,0 +1,14 @@
+# project/benchmarks/bench_population.py
+
+from loadtest.fake_discord import FakeWorld
+from utils.population import build_roster, tracked_roles_by_position
+
+
+def run(suite, quick: bool):
+    for members in ([10_000] if quick else [10_000, 100_000]):
+        world = FakeWorld(seed=members)
+        guild = world.build_guild(members, tracked_roles=5, untracked_roles=20)
+        sections = {str(role.id): {'header': role.name, 'role_name': role.name, 'position': role.position} for role in guild.tracked_roles}
+        role_ids = tracked_roles_by_position(guild, sections)
+        snapshot = guild.members
+        suite.measure(f"population.build_roster[members={members}]", lambda: build_roster(snapshot, role_ids), number=1)
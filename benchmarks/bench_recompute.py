@@ -0,0 +1,52 @@
+# project/benchmarks/bench_recompute.py
+
+import random
+
+from loadtest.fake_discord import FakeWorld
+from utils import recompute
+from utils.data_manager import CompositionListData
+
+LISTS = 5
+
+
+def _make_lists(guild, count: int):
+    """
+    Списки по случайным подмножествам отслеживаемых ролей, состав пустой - пересборка с нуля.
+    Последний список без секций: так выглядит список, все роли которого удалены.
+    """
+    rng = random.Random(guild.id)
+    lists = []
+    for i in range(count):
+        roles = rng.sample(guild.tracked_roles, rng.randint(2, len(guild.tracked_roles)))
+        sections = {str(role.id): {'header': role.name, 'role_name': role.name, 'position': role.position} for role in roles}
+        lists.append(CompositionListData(i + 1, 1, guild.id, f"Список {i}", sections, {}))
+    lists.append(CompositionListData(count + 1, 1, guild.id, "Список без ролей", {}, {}))
+    return lists
+
+
+def _without_numpy(fn):
+    """Вызывает fn с отключённым NumPy - чистый Python-путь recompute_rosters."""
+    def call():
+        np, recompute.np = recompute.np, None
+        try:
+            return fn()
+        finally:
+            recompute.np = np
+    return call
+
+
+def run(suite, quick: bool):
+    for members in ([10_000] if quick else [10_000, 100_000]):
+        world = FakeWorld(seed=members)
+        guild = world.build_guild(members, tracked_roles=8, untracked_roles=20)
+        lists = _make_lists(guild, LISTS)
+        snapshot = guild.members
+
+        def rebuild():
+            return recompute.recompute_rosters(guild, snapshot, lists)
+
+        suite.measure(f"recompute.python[members={members},lists={LISTS}]", _without_numpy(rebuild), number=1)
+        if recompute.np is None:
+            print("  NumPy не установлен - векторизованный путь пропущен")
+            continue
+        suite.measure(f"recompute.numpy[members={members},lists={LISTS}]", rebuild, number=1)
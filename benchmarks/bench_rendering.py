@@ -0,0 +1,15 @@
+# project/benchmarks/bench_rendering.py
+
+import random
+
+from benchmarks.common import make_sections, make_users
+from cogs.composition import generate_message_content
+from utils.data_manager import CompositionListData
+
+
+def run(suite, quick: bool):
+    rng = random.Random(0)
+    for users in ([10, 1_000] if quick else [10, 100, 1_000, 5_000]):
+        sections = make_sections(rng, 5)
+        db_list = CompositionListData(1, 1, 1, "Список", sections, make_users(rng, sections, users))
+        suite.measure(f"render.generate_message_content[users={users}]", lambda: generate_message_content(db_list))
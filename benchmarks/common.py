@@ -0,0 +1,61 @@
+# project/benchmarks/common.py
+
+import os
+import random
+import statistics
+import tempfile
+import timeit
+
+# Бенчмарки работают с временной базой: задаём её до импорта модулей бота
+WORK_DIR = tempfile.mkdtemp(prefix='composition-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(WORK_DIR, 'default.db')}")
+
+
+class Suite:
+    """
+    Собирает результаты замеров: {имя: {'median_s', 'min_s', 'number', 'repeat'}}
+    и размеры данных: {имя: байт}.
+    """
+    def __init__(self, repeat: int = 5):
+        self.repeat = repeat
+        self.results = {}
+        self.sizes = {}
+
+    def measure(self, name: str, fn, number: int = None):
+        """Замеряет время одного вызова fn (медиана по repeat прогонам)."""
+        timer = timeit.Timer(fn)
+        if number is None:
+            # Подбираем число вызовов так, чтобы один прогон занимал не меньше 0.2 с
+            number, _ = timer.autorange()
+        runs = [t / number for t in timer.repeat(repeat=self.repeat, number=number)]
+        self.results[name] = {
+            'median_s': statistics.median(runs),
+            'min_s': min(runs),
+            'number': number,
+            'repeat': self.repeat,
+        }
+        print(f"  {name:<70} {statistics.median(runs) * 1e6:>12.1f} мкс/оп")
+        return self.results[name]
+
+    def record_size(self, name: str, size: int):
+        """Запоминает размер данных (в сравнение с базовым прогоном не входит)."""
+        self.sizes[name] = size
+        print(f"  {name:<70} {size:>12} байт")
+
+
+def make_sections(rng: random.Random, roles: int) -> dict:
+    """Секции списка в формате столбца sections."""
+    sections = {}
+    for position in rng.sample(range(1, roles * 10), roles):
+        role_id = str(rng.getrandbits(60))
+        sections[role_id] = {'header': f"Роль {position}", 'role_name': f"Роль {position}", 'position': position}
+    return sections
+
+
+def make_users(rng: random.Random, sections: dict, users: int) -> dict:
+    """Участники, случайно распределённые по секциям, в формате столбца current_users."""
+    current_users = {role_id: [] for role_id in sections}
+    role_ids = list(sections)
+    for _ in range(users):
+        current_users[rng.choice(role_ids)].append(f"<@{rng.getrandbits(60)}>")
+    return current_users
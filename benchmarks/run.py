@@ -0,0 +1,103 @@
+# project/benchmarks/run.py
+"""
+Бенчмарки слоя данных, отрисовки и пакетной обработки.
+
+Запуск из корня проекта:
+    python -m benchmarks.run                      # полный набор, результат в benchmarks/results/<commit>.json
+    python -m benchmarks.run --quick --only batch
+    python -m benchmarks.run --compare benchmarks/results/abc1234.json --threshold 0.15
+
+При --compare код возврата 1, если какой-либо замер медленнее базового больше чем на threshold.
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+
+# common настраивает временную БД до импорта модулей бота
+from benchmarks.common import Suite
+
+MODULES = {
+    'data_layer': 'benchmarks.bench_data_layer',
+    'rendering': 'benchmarks.bench_rendering',
+    'batch': 'benchmarks.bench_batch',
+    'population': 'benchmarks.bench_population',
+    'recompute': 'benchmarks.bench_recompute',
+}
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Печатает сравнение с базовым прогоном и возвращает список регрессий."""
+    regressions = []
+    print(f"\nСравнение с {baseline['meta'].get('commit', '?')} (порог {threshold:.0%}):")
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        ratio = result['median_s'] / base['median_s']
+        mark = ''
+        if ratio > 1 + threshold:
+            mark = '  <-- регрессия'
+            regressions.append((name, ratio))
+        print(f"  {name:<70} {ratio:>6.2f}x{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки CompositionCog и DatabaseManager.")
+    parser.add_argument('--only', action='append', choices=sorted(MODULES), help="Запустить только указанные группы")
+    parser.add_argument('--quick', action='store_true', help="Уменьшенные размеры данных")
+    parser.add_argument('--repeat', type=int, default=5, help="Число повторов каждого замера")
+    parser.add_argument('--output', help="Куда сохранить JSON (по умолчанию benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', help="JSON предыдущего прогона для сравнения")
+    parser.add_argument('--threshold', type=float, default=0.15, help="Допустимое замедление, доля (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    suite = Suite(repeat=args.repeat)
+    for group in args.only or MODULES:
+        print(f"[{group}]")
+        importlib.import_module(MODULES[group]).run(suite, args.quick)
+
+    commit = git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'quick': args.quick,
+        },
+        'results': suite.results,
+        'sizes': suite.sizes,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены в {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\nНайдено регрессий: {len(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
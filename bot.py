@@ -4,25 +4,67 @@ import discord
 from discord.ext import commands
 import asyncio
 import logging
+import signal
 
-from config.settings import TOKEN
+from config.settings import (
+    TOKEN, MEMBER_CACHE_ENABLED, SHUTDOWN_TIMEOUT, METRICS_ENABLED, METRICS_HOST, METRICS_PORT,
+    LOOP_LAG_MONITOR_ENABLED, LOOP_LAG_INTERVAL, LOOP_LAG_WARN_THRESHOLD,
+    SLOW_CALLBACK_TRACER_ENABLED, SLOW_CALLBACK_THRESHOLD,
+    LOG_LEVEL, LOG_FORMAT, LOG_FILE, LOG_FILE_MAX_BYTES, LOG_FILE_BACKUP_COUNT
+)
 from utils.data_manager import db_manager
 from utils.error_handler import BotErrorHandler
+from utils.rest_scheduler import RestScheduler
+from utils import metrics
+from utils.loop_monitor import LoopLagMonitor, SlowCallbackTracer
+from utils.logging_setup import setup_logging
 
 # --- Настройка ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Логи пишет фоновый поток: event loop только кладёт записи в очередь
+log_listener = setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_FILE, LOG_FILE_MAX_BYTES, LOG_FILE_BACKUP_COUNT)
 
 intents = discord.Intents.default()
 intents.members = True
 intents.guilds = True
 
+# Без кеша участников списки работают через индекс ролей и raw GUILD_MEMBER_UPDATE
+member_cache_flags = discord.MemberCacheFlags.from_intents(intents) if MEMBER_CACHE_ENABLED else discord.MemberCacheFlags.none()
+
 class MyBot(commands.Bot):
     def __init__(self):
-        super().__init__(command_prefix="!", intents=intents)
+        # Планировщик читает заголовки лимитов через http_trace клиента discord.py
+        rest_scheduler = RestScheduler()
+        super().__init__(
+            command_prefix="!",
+            intents=intents,
+            member_cache_flags=member_cache_flags,
+            # Без кеша участники загружаются разово при построении индекса ролей
+            chunk_guilds_at_startup=MEMBER_CACHE_ENABLED,
+            http_trace=rest_scheduler.trace_config(),
+        )
         # Подключаем менеджеры к боту для доступа из Cogs
         self.db = db_manager
+        self.rest_scheduler = rest_scheduler
+        self.metrics_runner = None
+        self.shutdown_task = None
+        self.composition_state = None  # Состояние CompositionCog на время перезагрузки кога
+        self.composition_handoff = None  # События CompositionCog, пришедшие во время перезагрузки кога
+        self.loop_lag_monitor = LoopLagMonitor(LOOP_LAG_INTERVAL, LOOP_LAG_WARN_THRESHOLD)
+        self.slow_callback_tracer = SlowCallbackTracer(SLOW_CALLBACK_THRESHOLD)
 
     async def setup_hook(self):
+        if LOOP_LAG_MONITOR_ENABLED:
+            self.loop_lag_monitor.start()
+        if SLOW_CALLBACK_TRACER_ENABLED:
+            self.slow_callback_tracer.install()
+
+        if METRICS_ENABLED:
+            metrics.gateway_latency.set_function(lambda: self.latency)
+            try:
+                self.metrics_runner = await metrics.start_metrics_server(METRICS_HOST, METRICS_PORT)
+            except OSError as e:
+                logging.error(f"Не удалось запустить эндпоинт метрик на {METRICS_HOST}:{METRICS_PORT}: {e}")
+
         # Загружаем все коги из папки cogs
         initial_extensions = ['cogs.composition']
         for extension in initial_extensions:
@@ -36,6 +78,41 @@ class MyBot(commands.Bot):
         synced = await self.tree.sync()
         logging.info(f"Синхронизировано {len(synced)} команд.")
 
+    async def close(self):
+        if not self.is_closed():
+            # Пока HTTP-сессия открыта, доводим очередь обновлений и сохраняем остаток
+            cog = self.get_cog('CompositionCog')
+            if cog:
+                try:
+                    await cog.drain(SHUTDOWN_TIMEOUT)
+                except Exception:
+                    # Остановка продолжается: соединения и БД закрываются в любом случае
+                    logging.exception("Ошибка при завершении пакетной обработки.")
+        self.loop_lag_monitor.stop()
+        self.slow_callback_tracer.uninstall()
+        if self.metrics_runner:
+            await self.metrics_runner.cleanup()
+        await super().close()
+        self.db.close()
+
+    def install_signal_handlers(self):
+        """SIGTERM/SIGINT запускают штатную остановку через close() вместо прерывания event loop."""
+        loop = asyncio.get_running_loop()
+
+        def request_shutdown(signame):
+            if self.shutdown_task is not None:
+                logging.warning(f"Получен {signame}: остановка уже идёт.")
+                return
+            logging.info(f"Получен {signame}, останавливаем бота.")
+            self.shutdown_task = loop.create_task(self.close())
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, request_shutdown, sig.name)
+            except NotImplementedError:
+                # Windows: у цикла нет add_signal_handler, обработчик сигнала передаёт вызов в event loop
+                signal.signal(sig, lambda signum, frame: loop.call_soon_threadsafe(request_shutdown, signal.Signals(signum).name))
+
     async def on_ready(self):
         logging.info(f'Бот {self.user} готов к работе!')
 
@@ -50,15 +127,23 @@ async def main():
         logging.critical("Токен Discord не найден. Проверьте .env файл.")
         return
     
+    bot.install_signal_handlers()
     try:
         await bot.start(TOKEN)
     except discord.LoginFailure:
         logging.critical("Неверный токен Discord. Не удалось войти.")
     except Exception as e:
         logging.critical(f"Критическая ошибка при запуске бота: {e}", exc_info=True)
+    finally:
+        # start() возвращается, как только закрыт шлюз; остановка ещё закрывает HTTP и БД
+        if bot.shutdown_task is not None:
+            await bot.shutdown_task
 
 if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        logging.info("Бот остановлен вручную.")
\ No newline at end of file
+        logging.info("Бот остановлен вручную.")
+    finally:
+        # Дописываем записи, оставшиеся в очереди
+        log_listener.stop()
\ No newline at end of file
@@ -5,50 +5,710 @@ from discord.ext import commands, tasks
 from discord import app_commands
 import re
 import asyncio
+import datetime
+import logging
+import time
 from collections import defaultdict
 
 from utils.data_manager import db_manager
 from utils.error_handler import BotErrorHandler
-from config.settings import BATCH_UPDATE_DELAY
+from utils.rest_scheduler import RequestShed, message_route
+from utils.population import load_members, populate_sections
+from utils.recompute import recompute_rosters
+from utils.role_index import RoleMemberIndex
+from utils.list_index import ListIndex
+from utils.raw_events import EventHandoff, RawMemberUpdateHook
+from utils.role_bitset import RoleBitset
+from utils import metrics
+from config.settings import (
+    BATCH_DEEP_QUEUE,
+    BATCH_HEADROOM_LOW,
+    BATCH_INTERVAL_MAX,
+    BATCH_INTERVAL_MIN,
+    HANDOFF_EVENT_LIMIT,
+    LIST_QUARANTINE_BASE_DELAY,
+    LIST_QUARANTINE_MAX_DELAY,
+    MEMBER_CACHE_ENABLED,
+    RAW_MEMBER_UPDATES,
+    RECONCILE_ON_STARTUP,
+)
+
+logger = logging.getLogger(__name__)
+
+LISTS_PER_PAGE = 10  # Полей на странице /показатьсписки (в embed не больше 25)
+
+# Коды ошибок Discord, после которых сообщение списка уже не вернуть
+UNKNOWN_CHANNEL = 10003
+UNKNOWN_MESSAGE = 10008
+
+MESSAGE_CHAR_LIMIT = 2000  # Длина content, сверх которой Discord отклоняет сообщение (400)
+
+# Версия формата состояния, передаваемого между экземплярами кога при перезагрузке;
+# меняется вместе с export_state, чтобы новый код не принял чужой формат
+STATE_VERSION = 1
 
 # --- Вспомогательные функции ---
-def generate_message_content(db_list) -> str:
-    """Генерирует контент сообщения на основе данных из БД."""
-    content = f"**{db_list.title}**\n\n"
+def batch_interval(queue_depth: int, headroom: float) -> float:
+    """
+    Окно накопления изменений перед проходом batch_processor. Растёт линейно с глубиной очереди
+    от BATCH_INTERVAL_MIN до BATCH_INTERVAL_MAX (глубокая очередь лучше схлопывается в одну правку).
+    Когда запас лимита правок сообщений падает ниже BATCH_HEADROOM_LOW, окно тянется к максимуму.
+    """
+    by_depth = BATCH_INTERVAL_MIN + (BATCH_INTERVAL_MAX - BATCH_INTERVAL_MIN) * min(queue_depth / BATCH_DEEP_QUEUE, 1.0)
+    pressure = max(1.0 - headroom / BATCH_HEADROOM_LOW, 0.0)
+    return max(by_depth, BATCH_INTERVAL_MAX * pressure)
+
+def generate_message_content(db_list, limit: int = MESSAGE_CHAR_LIMIT) -> str:
+    """
+    Генерирует контент сообщения на основе данных из БД.
+    Если состав не помещается в limit символов, секции сверху вниз показывают столько участников,
+    сколько влезает, а остальные заменяются строкой "…и ещё N".
+    """
     sorted_sections = sorted(db_list.sections.items(), key=lambda item: item[1].get('position', 0), reverse=True)
+    sections = [(section_data['header'], db_list.current_users.get(role_id, ())) for role_id, section_data in sorted_sections]
 
-    for role_id, section_data in sorted_sections:
-        header = section_data['header']
-        users_in_section = db_list.current_users.get(role_id, [])
-        
+    content = f"**{db_list.title}**\n\n"
+    for header, users in sections:
         content += f"**{header}**:\n"
-        if not users_in_section:
+        if not users:
             content += "  *Пока никого нет.*\n"
         else:
-            content += "\n".join(f"  • {user}" for user in users_in_section) + "\n"
+            content += "\n".join(f"  • {user}" for user in users) + "\n"
+        content += "\n"
+    if len(content.strip()) <= limit:
+        return content.strip()
+
+    # Место под заголовки и строки "…и ещё N" резервируется заранее, участники заполняют остаток;
+    # два завершающих перевода строки strip() уберёт
+    budget = limit + 2 - len(f"**{db_list.title}**\n\n")
+    for header, users in sections:
+        budget -= len(f"**{header}**:\n\n") + len(f"  …и ещё {len(users)}\n" if users else "  *Пока никого нет.*\n")
+
+    content = f"**{db_list.title}**\n\n"
+    for header, users in sections:
+        content += f"**{header}**:\n"
+        if not users:
+            content += "  *Пока никого нет.*\n"
+        else:
+            budget += len(f"  …и ещё {len(users)}\n")
+            user_lines = [f"  • {user}\n" for user in users]
+            if sum(map(len, user_lines)) > budget:
+                # Участники не помещаются целиком: строка "…и ещё N" возвращается в резерв
+                budget -= len(f"  …и ещё {len(users)}\n")
+                shown = 0
+                for line in user_lines:
+                    if len(line) > budget:
+                        break
+                    budget -= len(line)
+                    shown += 1
+                content += "".join(user_lines[:shown]) + f"  …и ещё {len(users) - shown}\n"
+            else:
+                content += "".join(user_lines)
+                budget -= sum(map(len, user_lines))
         content += "\n"
-    
-    return content.strip()
+
+    # Заголовков больше, чем помещается в сообщение - обрезаем как есть
+    return content.strip()[:limit]
+
+def section_order(sections) -> list:
+    """ID ролей секций в порядке вывода в сообщении (как в generate_message_content)."""
+    return [role_id for role_id, _ in sorted(sections.items(), key=lambda item: item[1].get('position', 0), reverse=True)]
+
+def patch_sections(guild, sections: dict) -> dict:
+    """
+    Сверяет секции списка с актуальными ролями сервера: обновляет название и позицию,
+    секции удалённых ролей убирает. Заголовок меняется, только если совпадал с названием роли.
+    """
+    patched = {}
+    for role_id, section_data in sections.items():
+        role = guild.get_role(int(role_id))
+        if role is None:
+            continue
+        header = role.name if section_data['header'] == section_data['role_name'] else section_data['header']
+        patched[role_id] = {**section_data, 'header': header, 'role_name': role.name, 'position': role.position}
+    return patched
+
+def strip_departed(current_users, member_ids) -> tuple:
+    """Убирает из состава участников, которых нет среди member_ids. Возвращает (новый состав, сколько убрано)."""
+    present = {f"<@{member_id}>" for member_id in member_ids}
+    new_users_data = dict(current_users)
+    removed = 0
+    for role_id, users in current_users.items():
+        kept = tuple(user for user in users if user in present)
+        if len(kept) != len(users):
+            new_users_data[role_id] = kept
+            removed += len(users) - len(kept)
+    return new_users_data, removed
+
+def merge_roster(current_users, roster: dict) -> tuple:
+    """
+    Накладывает пересобранный состав на сохранённый. Секции сравниваются как множества:
+    оставшиеся в секции участники сохраняют прежний порядок, новые добавляются в конец,
+    а совпадающие секции переиспользуются как есть. Возвращает (состав, изменился ли он).
+    """
+    merged = {}
+    changed = current_users.keys() != roster.keys()
+    for role_id, users in roster.items():
+        kept = current_users.get(role_id, ())
+        present = set(users)
+        if len(kept) == len(present) and present.issuperset(kept):
+            merged[role_id] = kept
+            continue
+        known = set(kept)
+        merged[role_id] = tuple(dict.fromkeys(user for user in kept if user in present)) + tuple(
+            user for user in users if user not in known
+        )
+        changed = True
+    return merged, changed
+
+def resolve_targets(bitset, list_mask: int, member_masks: dict) -> dict:
+    """
+    Секция (ID наивысшей роли) каждого изменившегося участника для списка с маской list_mask.
+    member_masks: {member_id: маска отслеживаемых ролей участника}. None - участник выбывает из списка.
+    """
+    return {f"<@{member_id}>": bitset.highest(mask & list_mask) for member_id, mask in member_masks.items()}
+
+def apply_member_updates(db_list, targets: dict):
+    """
+    Перемещает участников в секции из targets ({mention: role_id или None}).
+    Остальные участники и порядок внутри секций сохраняются.
+    Новый кортеж создаётся только для изменившихся секций, остальные переиспользуются.
+    Возвращает (новые current_users, были ли изменения).
+    """
+    updated = False
+    new_users_data = dict(db_list.current_users)
+    placed = set()
+
+    # Убираем участников, чья секция изменилась; секции без затронутых участников не обходим
+    for role_id, users in db_list.current_users.items():
+        if targets.keys().isdisjoint(users):
+            continue
+        section_id = int(role_id)
+        kept = []
+        for user in users:
+            target = targets.get(user, section_id)
+            if target == section_id and user not in placed:
+                kept.append(user)
+                if user in targets:
+                    placed.add(user)
+        if len(kept) != len(users):
+            new_users_data[role_id] = tuple(kept)
+            updated = True
+
+    # Добавляем участников в их новые секции
+    added = defaultdict(list)
+    for user, target in targets.items():
+        if target is not None and user not in placed:
+            added[str(target)].append(user)
+    for role_id, users in added.items():
+        new_users_data[role_id] = new_users_data.get(role_id, ()) + tuple(users)
+        updated = True
+
+    return new_users_data, updated
+
+def compute_list_updates(bitset, lists, member_masks: dict):
+    """
+    Пересчитывает все списки сервера для изменившихся участников.
+    Списки с одинаковым набором ролей (одна маска) группируются: секции участников
+    вычисляются один раз на группу. Если состав списка совпадает с уже пересчитанным
+    списком группы, результат (неизменяемые секции) переиспользуется без повторного прохода.
+    Возвращает [(db_list, новые current_users, были ли изменения), ...].
+    """
+    groups = defaultdict(list)
+    for db_list in lists:
+        groups[bitset.mask_for(db_list.sections)].append(db_list)
+
+    results = []
+    for list_mask, group in groups.items():
+        targets = resolve_targets(bitset, list_mask, member_masks)
+        computed = []  # [(исходный current_users, новый current_users, были ли изменения)]
+        for db_list in group:
+            for current_users, new_users_data, updated in computed:
+                # Сравнение словарей выполняется в C и заметно дешевле apply_member_updates
+                if db_list.current_users == current_users:
+                    break
+            else:
+                new_users_data, updated = apply_member_updates(db_list, targets)
+                computed.append((db_list.current_users, new_users_data, updated))
+            results.append((db_list, new_users_data, updated))
+    return results
 
 # --- Основной Cog ---
 class CompositionCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.update_queue = defaultdict(set) # {guild_id: {member_id, ...}}
+        self.departed = defaultdict(set) # {guild_id: {member_id, ...}} - покинувшие сервер участники из очереди
+        self.pending_renders = set() # {message_id, ...} - правки, отложенные из-за лимитов
+        self.role_index = RoleMemberIndex() # {guild_id: {role_id: {member_id, ...}}}
+        self.list_index = ListIndex() # {role_id: {message_id, ...}}
+        self.stale_sections = set() # {message_id, ...} - списки, чьи роли переименованы, сдвинуты или удалены
+        self.quarantine = {} # {message_id: (неудачных правок подряд, monotonic-время следующей попытки)}
+        self.parked_work = defaultdict(list) # {guild_id: [(kind, target_id), ...]} - сохранённая работа серверов, ещё не доступных после запуска
+        self.raw_member_hook = RawMemberUpdateHook(self.on_raw_member_roles)
+        self.renders_in_flight = 0
+        self.renders_idle = asyncio.Event() # Установлено, пока нет незавершённых правок сообщений
+        self.renders_idle.set()
+        self.batch_lock = asyncio.Lock() # Удерживается на время прохода batch_processor
+        self.work_arrived = asyncio.Event() # Будит batch_processor, когда в пустую очередь пришла работа
+        self.reindex_task = None # Пересборка серверов, если события за время перезагрузки не сохранились
+        self.closing = False # Бот останавливается: новые события не принимаются, остаток очереди уже сохранён
+        # Состояние, оставленное прежним экземпляром при перезагрузке кога
+        state = getattr(bot, 'composition_state', None)
+        bot.composition_state = None
+        if state is not None:
+            self.import_state(state)
         self.batch_processor.start()
 
-    def cog_unload(self):
-        self.batch_processor.cancel()
+    async def cog_load(self):
+        # События, пришедшие после выгрузки прежнего экземпляра, копятся в передаче до конца cog_load
+        handoff = getattr(self.bot, 'composition_handoff', None)
+        self.bot.composition_handoff = None
+        # Работа, не обработанная до прошлой остановки бота
+        self.restore_pending_work()
+        # Без кеша участников изменения ролей приходят только через raw-событие
+        raw_updates = RAW_MEMBER_UPDATES or not MEMBER_CACHE_ENABLED
+        if raw_updates and handoff is None:
+            self.raw_member_hook.install(self.bot._connection)
+        # При перезагрузке кога серверы уже доступны и on_guild_available не придёт
+        for guild in self.bot.guilds:
+            if self.role_index.is_built(guild.id):
+                # Индекс ролей передан прежним экземпляром: участников заново не загружаем
+                self.refresh_tracked_roles(guild)
+                self.release_parked_work(guild.id)
+            else:
+                await self.index_guild(guild)
+        if handoff is None:
+            return
+
+        # Отложенные события применяются по порядку; дальше до подключения слушателей
+        # discord.py (сразу после cog_load) нет ни одного await, и событие не потеряется
+        await handoff.hand_over(self)
+        if raw_updates:
+            self.raw_member_hook.install(self.bot._connection)
+        if handoff.overflowed:
+            self.reindex_task = asyncio.create_task(self.reindex_guilds([guild.id for guild in self.bot.guilds]))
+
+    async def cog_unload(self):
+        self.raw_member_hook.uninstall()
+        if self.closing:
+            # Остановка бота: очередь сохранена в drain(), передавать состояние некому
+            self.batch_processor.cancel()
+            if self.reindex_task is not None:
+                self.reindex_task.cancel()
+            return
+        # Слушатели кога discord.py уже снял: до подключения нового экземпляра события копит передача
+        handoff = self.bot.composition_handoff = EventHandoff(
+            self.bot, self, HANDOFF_EVENT_LIMIT,
+            raw_callback=self.on_raw_member_roles.__name__ if RAW_MEMBER_UPDATES or not MEMBER_CACHE_ENABLED else None,
+        )
+        if self.reindex_task is not None and not self.reindex_task.done():
+            # Пересборка не закончена - её повторит новый экземпляр
+            self.reindex_task.cancel()
+            handoff.overflowed = True
+        # Обработчики, запущенные до снятия слушателей, успевают записать события в очередь
+        await asyncio.sleep(0)
+        # Текущий проход доводится до конца, иначе скопированная им очередь потеряется
+        async with self.batch_lock:
+            self.batch_processor.cancel()
+        self.bot.composition_state = self.export_state()
+
+    # --- Передача состояния при перезагрузке кога ---
+    def export_state(self) -> dict:
+        """
+        Состояние кога из встроенных типов: очередь, карантин и индекс ролей.
+        Индекс списков не передаётся - он дёшево перечитывается из БД.
+        """
+        return {
+            'version': STATE_VERSION,
+            'update_queue': {guild_id: set(member_ids) for guild_id, member_ids in self.update_queue.items()},
+            'departed': {guild_id: set(member_ids) for guild_id, member_ids in self.departed.items()},
+            'pending_renders': set(self.pending_renders),
+            'stale_sections': set(self.stale_sections),
+            'quarantine': dict(self.quarantine),
+            'parked_work': {guild_id: list(parked) for guild_id, parked in self.parked_work.items()},
+            'role_index': self.role_index.export_state(),
+        }
+
+    def import_state(self, state: dict):
+        """Принимает состояние от прежнего экземпляра. Несовместимый формат отбрасывается."""
+        if state.get('version') != STATE_VERSION:
+            logger.warning(f"Состояние кога версии {state.get('version')} не поддерживается, индексы будут построены заново.")
+            return
+        for guild_id, member_ids in state['update_queue'].items():
+            self.update_queue[guild_id].update(member_ids)
+        for guild_id, member_ids in state['departed'].items():
+            self.departed[guild_id].update(member_ids)
+        self.pending_renders.update(state['pending_renders'])
+        self.stale_sections.update(state['stale_sections'])
+        self.quarantine.update(state['quarantine'])
+        for guild_id, parked in state.get('parked_work', {}).items():
+            self.parked_work[guild_id].extend(parked)
+        metrics.quarantined_lists.set(len(self.quarantine))
+        self.role_index.load_state(state['role_index'])
+        logger.info(f"Состояние кога принято: {sum(map(len, self.update_queue.values()))} участников в очереди, "
+                    f"индекс ролей для {len(state['role_index'])} серверов.")
+
+    # --- Остановка без потери обновлений ---
+    def pending_work(self) -> list:
+        """Необработанная работа в виде [(kind, guild_id, target_id), ...] для сохранения в БД."""
+        items = []
+        for guild_id, member_ids in self.update_queue.items():
+            departed = self.departed.get(guild_id, ())
+            items.extend(('departed' if member_id in departed else 'member', guild_id, member_id) for member_id in member_ids)
+        items.extend(('render', self.list_index.guild_of(message_id), message_id) for message_id in self.pending_renders)
+        items.extend(('stale', self.list_index.guild_of(message_id), message_id) for message_id in self.stale_sections)
+        items.extend((kind, guild_id, target_id) for guild_id, parked in self.parked_work.items() for kind, target_id in parked)
+        return items
+
+    def restore_pending_work(self):
+        """
+        Забирает работу, сохранённую при прошлой остановке. Она откладывается до тех пор,
+        пока сервер не станет доступен и не будет проиндексирован (release_parked_work):
+        иначе первый проход batch_processor отбросил бы её, не найдя сервер.
+        """
+        rows = db_manager.take_pending_work()
+        for kind, guild_id, target_id in rows:
+            self.parked_work[guild_id].append((kind, target_id))
+        if rows:
+            logger.info(f"Восстановлено необработанных задач с прошлого запуска: {len(rows)}.")
+        # Задачи без сервера (список не был в индексе) возвращаются в очередь сразу
+        self.release_parked_work(None)
+
+    def release_parked_work(self, guild_id):
+        """Возвращает в очередь отложенную работу сервера, как только его индексы готовы."""
+        parked = self.parked_work.pop(guild_id, ())
+        for kind, target_id in parked:
+            if kind in ('member', 'departed'):
+                self.update_queue[guild_id].add(target_id)
+                if kind == 'departed':
+                    self.departed[guild_id].add(target_id)
+            elif kind == 'render':
+                self.pending_renders.add(target_id)
+            elif kind == 'stale':
+                self.stale_sections.add(target_id)
+        if parked:
+            self.work_arrived.set()
+
+    def stop_intake(self):
+        """Перестаёт принимать события перед финальным сохранением очереди при остановке бота."""
+        self.closing = True
+        self.raw_member_hook.uninstall()
+
+    async def drain(self, timeout: float):
+        """
+        Завершает пакетную обработку перед остановкой бота:
+        останавливает цикл batch_processor (текущий проход доводится до конца), обрабатывает
+        накопленную очередь, ждёт незавершённые правки сообщений и сохраняет в БД всё,
+        что не успело обработаться за timeout секунд. События, пришедшие во время остановки,
+        попадают в очередь и сохраняются вместе с ней; после сохранения события не принимаются.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        scheduler = self.bot.rest_scheduler
+
+        try:
+            # Дожидаемся конца текущего прохода; отмена между проходами ничего не теряет
+            await asyncio.wait_for(self.batch_lock.acquire(), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            logger.warning("Текущий проход пакетной обработки не завершился до срока остановки и будет прерван.")
+            self.batch_processor.cancel()
+        else:
+            self.batch_processor.cancel()
+            self.batch_lock.release()
+
+        # Правки, которые не успеют выполниться до срока, планировщик отбросит в pending_renders
+        remaining = len(self.pending_work())
+        while remaining and loop.time() < deadline:
+            scheduler.max_delay = min(scheduler.max_delay, max(deadline - loop.time(), 0))
+            try:
+                await asyncio.wait_for(self.process_batch(), max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                break
+            except Exception as e:
+                # Остановка продолжается: необработанное сохранится в БД ниже
+                await BotErrorHandler.handle(e, "drain")
+                break
+            left = len(self.pending_work())
+            if left >= remaining:
+                # Остались только отложенные из-за лимитов правки - их сохраним
+                break
+            remaining = left
+
+        try:
+            await asyncio.wait_for(self.renders_idle.wait(), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            logger.warning(f"Остановка без ожидания {self.renders_in_flight} незавершённых правок сообщений.")
+
+        # Дальше события не принимаются: всё принятое либо обработано, либо попадёт в сохранённый остаток
+        self.stop_intake()
+        items = self.pending_work()
+        db_manager.save_pending_work(items)
+        logger.info(f"Пакетная обработка остановлена, сохранено необработанных задач: {len(items)}.")
+
+    # --- Индексы ролей и списков ---
+    async def index_guild(self, guild):
+        """
+        Загружает списки сервера в индекс списков и строит индекс ролей: по кешу участников,
+        а при отключённом кеше - по разовому снимку. Возвращает снимок участников, если он загружался.
+        """
+        self.list_index.set_guild(guild.id, db_manager.get_lists_for_guild(guild.id))
+        tracked = self.list_index.roles_for_guild(guild.id)
+        members = None
+        if guild.chunked:
+            self.role_index.build(guild, tracked)
+        elif not MEMBER_CACHE_ENABLED:
+            # Объекты Member из снимка не кешируются и освобождаются после построения индекса
+            members = await load_members(guild) if tracked else []
+            self.role_index.build(guild, tracked, members)
+        self.release_parked_work(guild.id)
+        return members
+
+    def refresh_tracked_roles(self, guild):
+        """Синхронизирует индексы после создания или удаления списка."""
+        if guild is not None:
+            self.list_index.set_guild(guild.id, db_manager.get_lists_for_guild(guild.id))
+            self.role_index.set_tracked(guild, self.list_index.roles_for_guild(guild.id))
+
+    def save_list(self, db_list, new_sections=None, new_users=None):
+        """
+        Записывает новый состав или секции списка в БД и обновляет его сводку в индексе списков,
+        чтобы команды только на чтение отвечали по памяти. Возвращает обновлённый снимок списка.
+        """
+        db_manager.update_list_content(db_list.message_id, new_sections=new_sections, new_users=new_users)
+        changes = {'updated_at': datetime.datetime.utcnow()}
+        if new_sections is not None:
+            changes['sections'] = new_sections
+        if new_users is not None:
+            changes['current_users'] = new_users
+        db_list = db_list.replace(**changes)
+        if new_sections is not None:
+            self.list_index.add(db_list)
+        else:
+            self.list_index.touch(db_list.message_id, db_list.updated_at)
+        return db_list
+
+    def forget_lists(self, message_ids):
+        """Убирает удаляемые списки из индекса, карантина и всей отложенной работы."""
+        for message_id in message_ids:
+            self.list_index.remove(message_id)
+            self.stale_sections.discard(message_id)
+            self.pending_renders.discard(message_id)
+            self.quarantine.pop(message_id, None)
+        metrics.quarantined_lists.set(len(self.quarantine))
+
+    def tombstone_lists(self, message_ids):
+        """Удаляет списки, чьё сообщение, канал или сервер больше не существуют."""
+        message_ids = set(message_ids)
+        if not message_ids:
+            return
+        deleted = db_manager.delete_lists(message_ids)
+
+        guild_ids = {self.list_index.guild_of(message_id) for message_id in message_ids} - {None}
+        self.forget_lists(message_ids)
+
+        for guild_id in guild_ids:
+            guild = self.bot.get_guild(guild_id)
+            if guild is not None:
+                self.role_index.set_tracked(guild, self.list_index.roles_for_guild(guild_id))
+        logger.info(f"Удалено списков без сообщения: {deleted}.")
+
+    def quarantine_list(self, message_id: int):
+        """Откладывает правки списка с экспоненциально растущей задержкой после каждой неудачи."""
+        failures = self.quarantine.get(message_id, (0, 0.0))[0] + 1
+        delay = min(LIST_QUARANTINE_BASE_DELAY * 2 ** (failures - 1), LIST_QUARANTINE_MAX_DELAY)
+        self.quarantine[message_id] = (failures, time.monotonic() + delay)
+        metrics.quarantined_lists.set(len(self.quarantine))
+        logger.warning(
+            f"Список {message_id} не удалось обновить {failures} раз(а) подряд, следующая попытка через {delay} с.",
+            extra={'list_id': message_id, 'guild_id': self.list_index.guild_of(message_id)}
+        )
+
+    async def sync_sections(self, message_id: int):
+        """
+        Переносит в секции списка актуальные названия и позиции ролей.
+        Если относительный порядок ролей списка изменился или роль удалена, участники списка
+        ставятся в очередь и будут распределены заново. Сдвиг абсолютных позиций без смены
+        порядка (например, при создании любой роли на сервере) только сохраняется в БД.
+        Возвращает обновлённый список, если сообщение нужно перерисовать, иначе None.
+        """
+        db_list = db_manager.get_list(message_id)
+        guild = self.bot.get_guild(db_list.guild_id) if db_list else None
+        if guild is None:
+            return None
+
+        new_sections = patch_sections(guild, db_list.sections)
+        if new_sections == db_list.sections:
+            return None
+
+        removed = db_list.sections.keys() - new_sections.keys()
+        kept_order = [role_id for role_id in section_order(db_list.sections) if role_id in new_sections]
+        reordered = bool(removed) or kept_order != section_order(new_sections)
+        renamed = any(section_data['header'] != db_list.sections[role_id]['header'] for role_id, section_data in new_sections.items())
+        if not reordered and not renamed:
+            # Вывод не меняется: обновляем позиции без перерисовки и без повторного распределения
+            self.save_list(db_list, new_sections=new_sections)
+            return None
+
+        new_users_data = {role_id: users for role_id, users in db_list.current_users.items() if role_id in new_sections}
+        # Участники удалённых секций убираются из списка и возвращаются в него через очередь
+        affected = {int(user.strip('<@!>')) for users in db_list.current_users.values() for user in users} if reordered else set()
+
+        db_list = self.save_list(db_list, new_sections=new_sections, new_users=new_users_data)
+
+        if removed:
+            self.role_index.set_tracked(guild, self.list_index.roles_for_guild(guild.id))
+        if affected:
+            self.update_queue[guild.id].update(affected)
+        return db_list
+
+    # --- Полная пересборка списков ---
+    async def reindex_guilds(self, guild_ids):
+        """
+        Заново строит индекс ролей и пересобирает списки серверов, когда события
+        за время перезагрузки кога не сохранились и переданный индекс мог устареть.
+        """
+        for guild_id in guild_ids:
+            guild = self.bot.get_guild(guild_id)
+            if guild is None:
+                continue
+            try:
+                self.role_index.drop(guild_id)
+                members = await self.index_guild(guild)
+                if guild.chunked or members is not None:
+                    await self.reconcile_guild(guild, members)
+            except Exception as e:
+                await BotErrorHandler.handle(e, "reindex_guilds")
+
+    async def reconcile_guild(self, guild, members=None) -> int:
+        """
+        Пересобирает все списки сервера с нуля по текущим ролям участников
+        и перерисовывает те, что разошлись с базой. Возвращает число изменённых списков.
+        members - уже загруженный снимок участников, чтобы не запрашивать его повторно.
+        """
+        all_lists = db_manager.get_lists_for_guild(guild.id)
+        if not all_lists:
+            return 0
+
+        # Роли могли быть переименованы, сдвинуты или удалены, пока бот был offline
+        stored_sections = {db_list.message_id: db_list.sections for db_list in all_lists}
+        all_lists = [db_list.replace(sections=patch_sections(guild, db_list.sections)) for db_list in all_lists]
+
+        if members is None:
+            members = await load_members(guild)
+        # Снимок участников уже сделан: матрицу ролей можно строить вне event loop
+        rosters = await asyncio.to_thread(recompute_rosters, guild, members, all_lists)
+
+        changed = 0
+        for db_list in all_lists:
+            # Порядок участников в секции не важен: перестановка не считается изменением
+            new_users_data, users_changed = merge_roster(db_list.current_users, rosters[db_list.message_id])
+            if not users_changed and db_list.sections == stored_sections[db_list.message_id]:
+                continue
+            await self.render_list(self.save_list(db_list, new_sections=db_list.sections, new_users=new_users_data))
+            changed += 1
+        self.refresh_tracked_roles(guild)
+
+        logger.info(f"Списки сервера {guild.id} пересобраны: изменено {changed} из {len(all_lists)}.")
+        return changed
+
+    async def compact_guild(self, guild) -> int:
+        """
+        Разовая очистка: убирает из списков сервера участников, покинувших его до того,
+        как бот начал обрабатывать выход участников. Возвращает число убранных записей.
+        """
+        all_lists = db_manager.get_lists_for_guild(guild.id)
+        if not all_lists:
+            return 0
+
+        member_ids = [member.id for member in await load_members(guild)]
+        total = 0
+        for db_list in all_lists:
+            new_users_data, removed = strip_departed(db_list.current_users, member_ids)
+            if not removed:
+                continue
+            await self.render_list(self.save_list(db_list, new_users=new_users_data))
+            total += removed
+
+        logger.info(f"Списки сервера {guild.id} очищены: убрано {total} покинувших сервер участников.")
+        return total
 
     # --- Пакетная обработка обновлений для производительности ---
-    @tasks.loop(seconds=BATCH_UPDATE_DELAY)
+    @tasks.loop(seconds=0)
     async def batch_processor(self):
-        if not self.update_queue:
-            return
+        # Ожидание идёт без batch_lock: остановка и перезагрузка прерывают его без потерь
+        await self.wait_for_batch()
+        async with self.batch_lock:
+            with metrics.batch_duration.time():
+                await self.process_batch()
+
+    @batch_processor.error
+    async def batch_processor_error(self, error):
+        # Без перезапуска tasks.loop останавливается навсегда и очередь больше не обрабатывается
+        await BotErrorHandler.handle(error, "batch_processor")
+        self.batch_processor.get_task().add_done_callback(self.restart_batch_processor)
+
+    def restart_batch_processor(self, task):
+        """Запускает цикл заново, когда его задача завершилась с уже записанной ошибкой."""
+        if not task.cancelled():
+            task.exception()  # Ошибка записана в batch_processor_error
+            self.batch_processor.start()
+
+    def queue_depth(self) -> int:
+        """Сколько работы ждёт прохода: участники в очереди, отложенные правки и списки с устаревшими секциями."""
+        return sum(map(len, self.update_queue.values())) + len(self.pending_renders) + len(self.stale_sections)
+
+    def queued_routes(self) -> set:
+        """Маршруты правок каналов, в которых ждут обновления списки: для оценки запаса лимитов."""
+        message_ids = set(self.pending_renders) | self.stale_sections
+        for guild_id, member_ids in self.update_queue.items():
+            if member_ids:
+                message_ids |= self.list_index.lists_for_guild(guild_id)
+        summaries = filter(None, map(self.list_index.summary, message_ids))
+        return {message_route('PATCH', summary.channel_id) for summary in summaries}
+
+    async def wait_for_batch(self):
+        """
+        Спит, пока нет работы (или до истечения ближайшего карантина), затем держит окно накопления.
+        Длина окна пересчитывается по ходу: если очередь растёт или лимиты правок кончаются, окно удлиняется.
+        """
+        while not self.queue_depth():
+            self.work_arrived.clear()
+            retry_at = min((retry_at for _, retry_at in self.quarantine.values()), default=None)
+            timeout = max(retry_at - time.monotonic(), 0) if retry_at is not None else None
+            try:
+                await asyncio.wait_for(self.work_arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                # Истёк карантин списка - его проверит process_batch
+                break
+
+        opened = time.monotonic()
+        while True:
+            interval = batch_interval(self.queue_depth(), self.bot.rest_scheduler.headroom(self.queued_routes()))
+            metrics.batch_interval.set(interval)
+            left = opened + interval - time.monotonic()
+            if left <= 0:
+                return
+            await asyncio.sleep(min(left, BATCH_INTERVAL_MIN))
+
+    async def process_batch(self):
+        # Правки этого цикла: не больше одной на список, сколько бы изменений ни накопилось
+        to_render = {}
+
+        if self.stale_sections:
+            stale = self.stale_sections.copy()
+            self.stale_sections.clear()
+            for message_id in stale:
+                db_list = await self.sync_sections(message_id)
+                if db_list:
+                    to_render[message_id] = db_list
 
         # Копируем очередь, чтобы избежать проблем с асинхронностью
         current_queue = self.update_queue.copy()
+        departed = self.departed.copy()
         self.update_queue.clear()
+        self.departed.clear()
+        metrics.update_queue_depth.clear()
 
         for guild_id, member_ids in current_queue.items():
             guild = self.bot.get_guild(guild_id)
@@ -60,186 +720,530 @@ class CompositionCog(commands.Cog):
             if not all_lists:
                 continue
             
-            # Получаем объекты участников - исправленный код
-            members = {}
+            # Роли компилируются в биты по актуальным позициям; маски участников берём из индекса ролей
+            bitset = RoleBitset.compile(guild, {role_id for db_list in all_lists for role_id in db_list.sections})
+            member_masks = self.member_masks(guild, bitset, member_ids, departed.get(guild_id, ()))
+
+            for db_list, new_users_data, updated in compute_list_updates(bitset, all_lists, member_masks):
+                if updated:
+                    to_render[db_list.message_id] = self.save_list(db_list, new_users=new_users_data)
+                elif db_list.message_id not in to_render:
+                    metrics.list_edits.inc(result='skipped')
+
+        # Повторяем правки, отложенные планировщиком из-за лимитов, и проверяем списки, чей карантин истёк
+        now = time.monotonic()
+        due = {message_id for message_id, (_, retry_at) in self.quarantine.items() if retry_at <= now}
+        pending = (self.pending_renders | due) - to_render.keys()
+        self.pending_renders.clear()
+        for message_id in pending:
+            db_list = db_manager.get_list(message_id)
+            if db_list:
+                to_render[message_id] = db_list
+            elif self.quarantine.pop(message_id, None):
+                # Список удалён в обход команд - карантин больше не нужен
+                metrics.quarantined_lists.set(len(self.quarantine))
+
+        for db_list in to_render.values():
             try:
-                # Используем async for для итерации по async generator
-                async for member in guild.fetch_members(limit=None):
-                    if member.id in member_ids:
-                        members[member.id] = member
-            except discord.Forbidden:
-                # Если нет прав на получение участников, используем кеш
-                members = {m.id: m for m in guild.members if m.id in member_ids}
+                await self.render_list(db_list)
             except Exception as e:
-                # В случае других ошибок логируем и пропускаем
-                print(f"Ошибка при получении участников для гильдии {guild_id}: {e}")
-                continue
-            
-            for db_list in all_lists:
-                updated = False
-                new_users_data = db_list.current_users.copy()
-                
-                for member_id in member_ids:
-                    member = members.get(member_id)
-                    if not member: continue
-
-                    user_mention = member.mention
-                    
-                    # Удаляем пользователя из всех секций
-                    for role_id in new_users_data:
-                        if user_mention in new_users_data[role_id]:
-                            new_users_data[role_id].remove(user_mention)
-                            updated = True
-                    
-                    # Находим его наивысшую роль и добавляем
-                    highest_role_id = None
-                    highest_pos = -1
-                    for role in member.roles:
-                        if str(role.id) in db_list.sections and role.position > highest_pos:
-                            highest_pos = role.position
-                            highest_role_id = str(role.id)
-                    
-                    if highest_role_id:
-                        if highest_role_id not in new_users_data:
-                            new_users_data[highest_role_id] = []
-                        new_users_data[highest_role_id].append(user_mention)
-                        updated = True
+                # Ошибка одного списка не прерывает проход и не теряет правки остальных
+                self.quarantine_list(db_list.message_id)
+                await BotErrorHandler.handle(e, "render_list")
 
-                if updated:
-                    db_manager.update_list_content(db_list.message_id, new_users=new_users_data)
-                    try:
-                        channel = await self.bot.fetch_channel(db_list.channel_id)
-                        message = await channel.fetch_message(db_list.message_id)
-                        await message.edit(content=generate_message_content(db_list))
-                    except (discord.NotFound, discord.Forbidden):
-                        # Если сообщение не найдено, оно будет удалено при следующей команде
-                        pass
+    def member_masks(self, guild, bitset, member_ids, departed=()) -> dict:
+        """
+        Маски отслеживаемых ролей участников: из индекса ролей, а без него - из кеша участников.
+        Покинувшие сервер получают пустую маску и убираются из всех списков.
+        """
+        if self.role_index.is_built(guild.id):
+            masks = {member_id: bitset.mask_for(self.role_index.roles_of(guild.id, member_id)) for member_id in member_ids}
+        else:
+            masks = {}
+            for member_id in member_ids:
+                member = guild.get_member(member_id)
+                if member:
+                    masks[member_id] = bitset.mask_for(role.id for role in member.roles)
+        for member_id in departed:
+            masks[member_id] = 0
+        return masks
+
+    async def render_list(self, db_list):
+        """Фоново перерисовывает сообщение списка через планировщик REST."""
+        quarantined = self.quarantine.get(db_list.message_id)
+        if quarantined and time.monotonic() < quarantined[1]:
+            # Состав в БД актуален, сообщение обновится при следующей проверке
+            metrics.list_edits.inc(result='quarantined')
+            return
+
+        # Частичное сообщение: одна правка вместо fetch_channel + fetch_message + edit
+        message = self.bot.get_partial_messageable(db_list.channel_id).get_partial_message(db_list.message_id)
+        content = generate_message_content(db_list)
+        self.renders_in_flight += 1
+        self.renders_idle.clear()
+        try:
+            await self.bot.rest_scheduler.background(
+                message_route('PATCH', db_list.channel_id),
+                lambda: message.edit(content=content)
+            )
+            metrics.list_edits.inc(result='sent')
+            if quarantined:
+                del self.quarantine[db_list.message_id]
+                metrics.quarantined_lists.set(len(self.quarantine))
+        except RequestShed:
+            # Бюджет маршрута исчерпан - перерисуем в следующем цикле
+            self.pending_renders.add(db_list.message_id)
+            metrics.list_edits.inc(result='shed')
+        except discord.NotFound as e:
+            metrics.list_edits.inc(result='failed')
+            if e.code in (UNKNOWN_CHANNEL, UNKNOWN_MESSAGE):
+                # Сообщение или канал удалены, пока бот был offline
+                self.tombstone_lists([db_list.message_id])
+            else:
+                self.quarantine_list(db_list.message_id)
+        except discord.Forbidden:
+            # Права могут вернуть - проверяем с растущей задержкой
+            metrics.list_edits.inc(result='failed')
+            self.quarantine_list(db_list.message_id)
+        except discord.HTTPException as e:
+            metrics.list_edits.inc(result='failed')
+            if e.status == 429:
+                # Лимит, не учтённый планировщиком - перерисуем в следующем цикле
+                self.pending_renders.add(db_list.message_id)
+            else:
+                # Ошибка Discord (5xx) или отклонённая правка (400) - проверяем с растущей задержкой
+                self.quarantine_list(db_list.message_id)
+        finally:
+            self.renders_in_flight -= 1
+            if not self.renders_in_flight:
+                self.renders_idle.set()
     
     # --- События ---
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild):
+        # Срабатывает после загрузки участников сервера при старте
+        members = await self.index_guild(guild)
+        if RECONCILE_ON_STARTUP and (guild.chunked or members is not None):
+            # Пока бот был offline, роли могли измениться без событий on_member_update
+            await self.reconcile_guild(guild, members)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        await self.index_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        # Бота удалили с сервера или сервер удалён - списки больше не обновить
+        self.tombstone_lists(self.list_index.lists_for_guild(guild.id))
+        self.role_index.drop(guild.id)
+        self.list_index.drop_guild(guild.id)
+        self.parked_work.pop(guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload):
+        # Проверка по индексу в памяти: удаление обычных сообщений не стоит запроса к БД
+        if payload.message_id in self.list_index:
+            self.tombstone_lists([payload.message_id])
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload):
+        self.tombstone_lists(message_id for message_id in payload.message_ids if message_id in self.list_index)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.tombstone_lists(self.list_index.lists_for_channel(channel.id))
+
+    @commands.Cog.listener()
+    async def on_raw_thread_delete(self, payload):
+        self.tombstone_lists(self.list_index.lists_for_channel(payload.thread_id))
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before, after):
+        # При перестановке ролей Discord присылает событие на каждую сдвинутую роль:
+        # списки только помечаются, а правятся и перерисовываются один раз в batch_processor
+        if before.name != after.name or before.position != after.position:
+            self.mark_stale(self.list_index.lists_for_role(after.id))
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.mark_stale(self.list_index.lists_for_role(role.id))
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        self.role_index.update_member(member.guild.id, member.id, [role.id for role in member.roles])
+        # Вернулся до обработки очереди - его роли снова берутся из индекса или кеша
+        self.departed[member.guild.id].discard(member.id)
+
+    @commands.Cog.listener()
+    async def on_raw_member_remove(self, payload):
+        # Raw-событие приходит и без кеша участников
+        self.evict_member(payload.guild_id, payload.user.id)
+
+    @commands.Cog.listener()
+    async def on_member_ban(self, guild, user):
+        # Обычно вместе с баном приходит и удаление участника; повторная постановка в очередь объединится
+        self.evict_member(guild.id, user.id)
+
     @commands.Cog.listener()
     async def on_member_update(self, before, after):
+        if self.raw_member_hook.installed and self.role_index.is_built(after.guild.id):
+            # Уже обработано on_raw_member_roles
+            return
         if before.roles != after.roles:
-            # Ставим обновление в очередь для пакетной обработки
-            self.update_queue[after.guild.id].add(after.id)
+            self.role_index.update_member(after.guild.id, after.id, [role.id for role in after.roles])
+            self.enqueue_member(after.guild.id, after.id)
+
+    def on_raw_member_roles(self, guild_id: int, member_id: int, role_ids):
+        """
+        Быстрый путь GUILD_MEMBER_UPDATE: вызывается из парсера событий до построения Member
+        и работает без кеша участников. В очередь попадают только изменения отслеживаемых ролей.
+        """
+        if not self.role_index.is_built(guild_id):
+            # Индекса ещё нет - событие обработает on_member_update по кешу
+            return
+        if self.role_index.update_member(guild_id, member_id, role_ids):
+            self.enqueue_member(guild_id, member_id)
+        else:
+            metrics.member_updates.inc(result='untracked')
+
+    def enqueue_member(self, guild_id: int, member_id: int):
+        """Ставит участника в очередь для пакетной обработки."""
+        if self.closing:
+            return
+        queued = self.update_queue[guild_id]
+        metrics.member_updates.inc(result='coalesced' if member_id in queued else 'queued')
+        queued.add(member_id)
+        metrics.update_queue_depth.set(len(queued), guild_id=guild_id)
+        self.work_arrived.set()
+
+    def mark_stale(self, message_ids):
+        """Помечает списки, чьи секции нужно сверить с ролями сервера при следующем проходе."""
+        if self.closing:
+            return
+        message_ids = set(message_ids)
+        if message_ids:
+            self.stale_sections.update(message_ids)
+            self.work_arrived.set()
+
+    def evict_member(self, guild_id: int, member_id: int):
+        """Убирает участника из всех списков сервера при следующей пакетной обработке."""
+        if self.closing:
+            return
+        self.role_index.remove_member(guild_id, member_id)
+        self.departed[guild_id].add(member_id)
+        self.enqueue_member(guild_id, member_id)
 
     # --- Слеш команды ---
     @app_commands.command(name="создатьсписоксостава", description="Создает новый список для отслеживания состава.")
     @app_commands.default_permissions(administrator=True)
     async def create_list(self, interaction: discord.Interaction, title: str, roles: str):
-        try:
-            await interaction.response.defer(ephemeral=True)
+        async with self.bot.rest_scheduler.interactive():
+            try:
+                await interaction.response.defer(ephemeral=True)
 
-            role_ids = re.findall(r'<@&(\d+)>', roles)
-            if not role_ids or len(role_ids) != len(set(role_ids)):
-                await interaction.followup.send("Ошибка: Укажите уникальные роли для отслеживания.", ephemeral=True)
-                return
+                role_ids = re.findall(r'<@&(\d+)>', roles)
+                if not role_ids or len(role_ids) != len(set(role_ids)):
+                    await interaction.followup.send("Ошибка: Укажите уникальные роли для отслеживания.", ephemeral=True)
+                    return
             
-            sections = {}
-            for role_id_str in role_ids:
-                role = interaction.guild.get_role(int(role_id_str))
-                if role:
-                    sections[str(role.id)] = {
-                        'header': role.name,
-                        'role_name': role.name,
-                        'position': role.position
-                    }
+                sections = {}
+                for role_id_str in role_ids:
+                    role = interaction.guild.get_role(int(role_id_str))
+                    if role:
+                        sections[str(role.id)] = {
+                            'header': role.name,
+                            'role_name': role.name,
+                            'position': role.position
+                        }
             
-            # Создаем "пустое" сообщение, чтобы получить ID
-            message = await interaction.channel.send("Создание списка...")
+                # Создаем "пустое" сообщение, чтобы получить ID
+                message = await interaction.channel.send("Создание списка...")
 
-            # Сохраняем запись в БД и получаем её ID
-            new_list_id = db_manager.add_list(message.id, interaction.channel_id, interaction.guild_id, title, sections)
+                # Сразу заполняем список участниками, у которых уже есть отслеживаемые роли
+                current_users = await populate_sections(interaction.guild, sections, self.role_index)
+
+                # Сохраняем запись в БД одной операцией и получаем её ID
+                new_list_id = db_manager.add_list(message.id, interaction.channel_id, interaction.guild_id, title, sections, current_users)
             
-            # Используем ID, чтобы получить свежий, "живой" объект из БД
-            db_list = db_manager.get_list(new_list_id)
+                # Используем ID, чтобы получить свежий, "живой" объект из БД
+                db_list = db_manager.get_list(new_list_id)
+                self.list_index.add(db_list)
 
-            # Теперь db_list привязан к новой сессии и с ним можно безопасно работать
-            content = generate_message_content(db_list)
-            await message.edit(content=content)
-            await interaction.followup.send(f"Список состава создан! ID: `{message.id}`", ephemeral=True)
+                # Теперь db_list привязан к новой сессии и с ним можно безопасно работать
+                content = generate_message_content(db_list)
+                try:
+                    await message.edit(content=content)
+                except discord.HTTPException:
+                    # Без заполненного сообщения список не создан: убираем запись и заготовку
+                    self.forget_lists([message.id])
+                    db_manager.delete_list(message.id)
+                    try:
+                        await message.delete()
+                    except discord.HTTPException:
+                        pass
+                    raise
+                await interaction.followup.send(f"Список состава создан! ID: `{message.id}`", ephemeral=True)
 
-        except Exception as e:
-            await BotErrorHandler.handle(e, "создатьсписоксостава", interaction)
+            except Exception as e:
+                await BotErrorHandler.handle(e, "создатьсписоксостава", interaction)
 
     @app_commands.command(name="удалитьсписоксостава", description="Удаляет список состава по ID сообщения.")
     @app_commands.default_permissions(administrator=True)
     async def delete_list(self, interaction: discord.Interaction, message_id: str):
-        try:
-            await interaction.response.defer(ephemeral=True)
-            
-            # Проверяем, что ID является числом
+        async with self.bot.rest_scheduler.interactive():
             try:
-                msg_id = int(message_id)
-            except ValueError:
-                await interaction.followup.send("Ошибка: ID сообщения должен быть числом.", ephemeral=True)
-                return
+                await interaction.response.defer(ephemeral=True)
             
-            # Проверяем существование списка
-            db_list = db_manager.get_list(msg_id)
-            if not db_list:
-                await interaction.followup.send("Ошибка: Список с таким ID не найден.", ephemeral=True)
-                return
+                # Проверяем, что ID является числом
+                try:
+                    msg_id = int(message_id)
+                except ValueError:
+                    await interaction.followup.send("Ошибка: ID сообщения должен быть числом.", ephemeral=True)
+                    return
             
-            # Проверяем, что список принадлежит этому серверу
-            if db_list.guild_id != interaction.guild_id:
-                await interaction.followup.send("Ошибка: Этот список не принадлежит данному серверу.", ephemeral=True)
-                return
+                # Проверяем существование списка
+                db_list = db_manager.get_list(msg_id)
+                if not db_list:
+                    await interaction.followup.send("Ошибка: Список с таким ID не найден.", ephemeral=True)
+                    return
             
-            # Удаляем сообщение из Discord
-            try:
-                channel = await self.bot.fetch_channel(db_list.channel_id)
-                message = await channel.fetch_message(msg_id)
-                await message.delete()
-            except (discord.NotFound, discord.Forbidden):
-                # Сообщение уже удалено или нет прав - это нормально
-                pass
+                # Проверяем, что список принадлежит этому серверу
+                if db_list.guild_id != interaction.guild_id:
+                    await interaction.followup.send("Ошибка: Этот список не принадлежит данному серверу.", ephemeral=True)
+                    return
             
-            # Удаляем из базы данных
-            if db_manager.delete_list(msg_id):
-                await interaction.followup.send(f"Список '{db_list.title}' успешно удален.", ephemeral=True)
-            else:
-                await interaction.followup.send("Ошибка при удалении списка из базы данных.", ephemeral=True)
+                # Убираем из индекса заранее, чтобы событие удаления сообщения не удалило запись раньше команды
+                self.forget_lists([msg_id])
 
-        except Exception as e:
-            await BotErrorHandler.handle(e, "удалитьсписоксостава", interaction)
+                # Удаляем сообщение из Discord
+                try:
+                    message = self.bot.get_partial_messageable(db_list.channel_id).get_partial_message(msg_id)
+                    await message.delete()
+                except (discord.NotFound, discord.Forbidden):
+                    # Сообщение уже удалено или нет прав - это нормально
+                    pass
+            
+                # Удаляем из базы данных
+                if db_manager.delete_list(msg_id):
+                    self.refresh_tracked_roles(interaction.guild)
+                    await interaction.followup.send(f"Список '{db_list.title}' успешно удален.", ephemeral=True)
+                else:
+                    await interaction.followup.send("Ошибка при удалении списка из базы данных.", ephemeral=True)
 
-    @app_commands.command(name="показатьсписки", description="Показывает все списки состава на сервере.")
+            except Exception as e:
+                await BotErrorHandler.handle(e, "удалитьсписоксостава", interaction)
+
+    @delete_list.autocomplete('message_id')
+    async def list_id_autocomplete(self, interaction: discord.Interaction, current: str):
+        # Ответ из индекса в памяти: автодополнение вызывается на каждое нажатие клавиши
+        return [
+            app_commands.Choice(name=f"{title} ({message_id})"[:100], value=str(message_id))
+            for message_id, title in self.list_index.search(interaction.guild_id, current)
+        ]
+
+    @app_commands.command(name="пересобратьсписки", description="Пересобирает все списки состава сервера по текущим ролям участников.")
     @app_commands.default_permissions(administrator=True)
-    async def show_lists(self, interaction: discord.Interaction):
+    async def rebuild_lists(self, interaction: discord.Interaction):
+        # Интерактивный приоритет - только у ответов команды: пересборка и её правки идут фоново
         try:
-            await interaction.response.defer(ephemeral=True)
-            
-            all_lists = db_manager.get_lists_for_guild(interaction.guild_id)
-            
-            if not all_lists:
-                await interaction.followup.send("На этом сервере нет активных списков состава.", ephemeral=True)
+            async with self.bot.rest_scheduler.interactive():
+                await interaction.response.defer(ephemeral=True)
+
+            if not db_manager.get_lists_for_guild(interaction.guild_id):
+                async with self.bot.rest_scheduler.interactive():
+                    await interaction.followup.send("На этом сервере нет активных списков состава.", ephemeral=True)
                 return
-            
-            embed = discord.Embed(
-                title="📋 Списки состава на сервере",
-                color=discord.Color.blue()
-            )
-            
-            for db_list in all_lists:
-                channel = self.bot.get_channel(db_list.channel_id)
-                channel_name = channel.name if channel else "❌ Канал удален"
-                
-                embed.add_field(
-                    name=f"📝 {db_list.title}",
-                    value=f"**ID:** `{db_list.message_id}`\n"
-                          f"**Канал:** #{channel_name}\n"
-                          f"**Создан:** {db_list.created_at.strftime('%d.%m.%Y %H:%M') if db_list.created_at else 'Неизвестно'}",
-                    inline=False
+
+            changed = await self.reconcile_guild(interaction.guild)
+            async with self.bot.rest_scheduler.interactive():
+                await interaction.followup.send(f"Списки пересобраны. Изменено списков: {changed}.", ephemeral=True)
+
+        except Exception as e:
+            await BotErrorHandler.handle(e, "пересобратьсписки", interaction)
+
+    @app_commands.command(name="очиститьсписки", description="Убирает из списков состава участников, покинувших сервер.")
+    @app_commands.default_permissions(administrator=True)
+    async def compact_lists(self, interaction: discord.Interaction):
+        # Как и в /пересобратьсписки, правки списков идут фоново, вне интерактивного приоритета
+        try:
+            async with self.bot.rest_scheduler.interactive():
+                await interaction.response.defer(ephemeral=True)
+
+            removed = await self.compact_guild(interaction.guild)
+            async with self.bot.rest_scheduler.interactive():
+                await interaction.followup.send(f"Списки очищены. Убрано участников: {removed}.", ephemeral=True)
+
+        except Exception as e:
+            await BotErrorHandler.handle(e, "очиститьсписки", interaction)
+
+    @app_commands.command(name="ошибка", description="Показывает сведения об ошибке по её ID.")
+    @app_commands.default_permissions(administrator=True)
+    async def error_info(self, interaction: discord.Interaction, error_id: str):
+        async with self.bot.rest_scheduler.interactive():
+            try:
+                await interaction.response.defer(ephemeral=True)
+
+                report = db_manager.get_error_report(error_id.strip().strip('`'))
+                # Ошибки других серверов не показываем
+                if not report or report.guild_id not in (None, interaction.guild_id):
+                    await interaction.followup.send("Ошибка с таким ID не найдена.", ephemeral=True)
+                    return
+
+                embed = discord.Embed(
+                    title=f"🐞 Ошибка `{report.error_id}`",
+                    description=f"**{report.error_type}**: {report.message}",
+                    color=discord.Color.red()
                 )
-            
-            await interaction.followup.send(embed=embed, ephemeral=True)
+                embed.add_field(name="Контекст", value=report.context, inline=False)
+                embed.add_field(name="Время", value=report.created_at.strftime('%d.%m.%Y %H:%M:%S') if report.created_at else 'Неизвестно', inline=True)
+                embed.add_field(name="Пользователь", value=f"<@{report.user_id}>" if report.user_id else 'Нет', inline=True)
+                # Счётчик повторов живёт в памяти до перезапуска или вытеснения
+                stats = BotErrorHandler.stats.get(report.fingerprint)
+                if stats:
+                    embed.add_field(name="Повторов с запуска", value=str(stats.count), inline=True)
+                if report.traceback:
+                    embed.add_field(name="Traceback", value=f"```{report.traceback[-1000:]}```", inline=False)
+
+                await interaction.followup.send(embed=embed, ephemeral=True)
+
+            except Exception as e:
+                await BotErrorHandler.handle(e, "ошибка", interaction)
+
+    @app_commands.command(name="перезагрузитькод", description="Перезагружает код списков состава без переподключения бота.")
+    @app_commands.default_permissions(administrator=True)
+    async def reload_code(self, interaction: discord.Interaction):
+        # Интерактивный приоритет - только у ответов: выгрузка ждёт фоновый проход с его правками
+        try:
+            # Перезагрузка затрагивает все серверы, поэтому доступна только владельцу бота
+            if not await self.bot.is_owner(interaction.user):
+                async with self.bot.rest_scheduler.interactive():
+                    await interaction.response.send_message("Эта команда доступна только владельцу бота.", ephemeral=True)
+                return
+
+            async with self.bot.rest_scheduler.interactive():
+                await interaction.response.defer(ephemeral=True)
+
+            started = time.perf_counter()
+            # Старый экземпляр оставляет состояние в bot.composition_state, новый принимает его в __init__
+            await self.bot.reload_extension(__name__)
+            async with self.bot.rest_scheduler.interactive():
+                await interaction.followup.send(f"Код перезагружен за {time.perf_counter() - started:.2f} с.", ephemeral=True)
 
         except Exception as e:
-            await BotErrorHandler.handle(e, "показатьсписки", interaction)
+            await BotErrorHandler.handle(e, "перезагрузитькод", interaction)
 
+    @app_commands.command(name="показатьсписки", description="Показывает все списки состава на сервере.")
+    @app_commands.default_permissions(administrator=True)
+    async def show_lists(self, interaction: discord.Interaction):
+        async with self.bot.rest_scheduler.interactive():
+            try:
+                if self.list_index.is_indexed(interaction.guild_id):
+                    # Сводки списков уже в памяти: отвечаем сразу, без defer и лишнего запроса к API
+                    view = ListBrowserView(interaction.guild_id, self.list_index)
+                    if not view.load_page():
+                        await interaction.response.send_message("На этом сервере нет активных списков состава.", ephemeral=True)
+                        return
+                    await interaction.response.send_message(embed=view.build_embed(self.bot), view=view, ephemeral=True)
+                    return
+
+                await interaction.response.defer(ephemeral=True)
+
+                view = ListBrowserView(interaction.guild_id)
+                if not view.load_page():
+                    await interaction.followup.send("На этом сервере нет активных списков состава.", ephemeral=True)
+                    return
+
+                await interaction.followup.send(embed=view.build_embed(self.bot), view=view, ephemeral=True)
+
+            except Exception as e:
+                await BotErrorHandler.handle(e, "показатьсписки", interaction)
 
 
 
+
+# --- Постраничный просмотр списков ---
+class ListBrowserView(discord.ui.View):
+    """
+    Листает списки сервера страницами по LISTS_PER_PAGE. Страницы берутся из индекса списков,
+    если сервер в нём есть, иначе каждая страница запрашивается из БД по кнопке.
+    """
+    def __init__(self, guild_id: int, list_index=None):
+        super().__init__(timeout=120.0)
+        self.guild_id = guild_id
+        self.list_index = list_index
+        self.rows = []
+        self.page = 0
+        self.has_prev = False
+        self.has_next = False
+
+    def load_page(self, after: int = 0, before: int = None) -> bool:
+        """Загружает страницу после ключа after или перед ключом before. Возвращает False, если она пуста."""
+        if self.list_index is not None and self.list_index.is_indexed(self.guild_id):
+            rows, has_more = self.list_index.page(self.guild_id, LISTS_PER_PAGE, after=after, before=before)
+        else:
+            rows, has_more = db_manager.get_list_page(self.guild_id, LISTS_PER_PAGE, after=after, before=before)
+        if not rows:
+            return False
+        self.rows = rows
+        if before is not None:
+            self.has_prev, self.has_next = has_more, True
+        else:
+            self.has_prev, self.has_next = after > 0, has_more
+        self.previous_page.disabled = not self.has_prev
+        self.next_page.disabled = not self.has_next
+        return True
+
+    def build_embed(self, bot) -> discord.Embed:
+        embed = discord.Embed(
+            title="📋 Списки состава на сервере",
+            color=discord.Color.blue()
+        )
+
+        for row in self.rows:
+            channel = bot.get_channel(row.channel_id)
+            channel_name = channel.name if channel else "❌ Канал удален"
+
+            embed.add_field(
+                name=f"📝 {row.title}",
+                value=f"**ID:** `{row.message_id}`\n"
+                      f"**Канал:** #{channel_name}\n"
+                      f"**Создан:** {row.created_at.strftime('%d.%m.%Y %H:%M') if row.created_at else 'Неизвестно'}",
+                inline=False
+            )
+
+        embed.set_footer(text=f"Страница {self.page + 1}")
+        return embed
+
+    async def show(self, interaction: discord.Interaction, after: int = 0, before: int = None, step: int = 0):
+        async with interaction.client.rest_scheduler.interactive():
+            try:
+                if self.load_page(after=after, before=before):
+                    self.page += step
+                else:
+                    # Списки удалили, пока страница была открыта - начинаем сначала
+                    self.page = 0
+                    if not self.load_page():
+                        await interaction.response.edit_message(content="На этом сервере нет активных списков состава.", embed=None, view=None)
+                        return
+                await interaction.response.edit_message(embed=self.build_embed(interaction.client), view=self)
+
+            except Exception as e:
+                await BotErrorHandler.handle(e, "показатьсписки", interaction)
+
+    @discord.ui.button(label='Назад', style=discord.ButtonStyle.secondary, emoji='◀️')
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, before=self.rows[0].message_id, step=-1)
+
+    @discord.ui.button(label='Вперёд', style=discord.ButtonStyle.secondary, emoji='▶️')
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, after=self.rows[-1].message_id, step=1)
+
+    async def on_timeout(self):
+        # Убираем кнопки по истечении времени
+        for item in self.children:
+            item.disabled = True
+
+
 # --- Вспомогательный класс для подтверждения удаления ---
 class DeleteConfirmView(discord.ui.View):
     def __init__(self, message_id: int, list_title: str):
@@ -249,28 +1253,35 @@ class DeleteConfirmView(discord.ui.View):
 
     @discord.ui.button(label='Да, удалить', style=discord.ButtonStyle.danger, emoji='🗑️')
     async def confirm_delete(self, interaction: discord.Interaction, button: discord.ui.Button):
-        try:
-            # Удаляем сообщение из Discord
+        async with interaction.client.rest_scheduler.interactive():
             try:
-                message = await interaction.channel.fetch_message(self.message_id)
-                await message.delete()
-            except (discord.NotFound, discord.Forbidden):
-                # Сообщение уже удалено или нет прав - это нормально
-                pass
+                cog = interaction.client.get_cog('CompositionCog')
+                if cog:
+                    # Убираем из индекса заранее, чтобы событие удаления сообщения не удалило запись раньше команды
+                    cog.forget_lists([self.message_id])
+
+                # Удаляем сообщение из Discord
+                try:
+                    await interaction.channel.get_partial_message(self.message_id).delete()
+                except (discord.NotFound, discord.Forbidden):
+                    # Сообщение уже удалено или нет прав - это нормально
+                    pass
             
-            # Удаляем из базы данных
-            if db_manager.delete_list(self.message_id):
-                embed = discord.Embed(
-                    title="✅ Список удален",
-                    description=f"Список **'{self.list_title}'** успешно удален.",
-                    color=discord.Color.green()
-                )
-                await interaction.response.edit_message(embed=embed, view=None)
-            else:
-                await interaction.response.send_message("Ошибка при удалении списка из базы данных.", ephemeral=True)
+                # Удаляем из базы данных
+                if db_manager.delete_list(self.message_id):
+                    if cog:
+                        cog.refresh_tracked_roles(interaction.guild)
+                    embed = discord.Embed(
+                        title="✅ Список удален",
+                        description=f"Список **'{self.list_title}'** успешно удален.",
+                        color=discord.Color.green()
+                    )
+                    await interaction.response.edit_message(embed=embed, view=None)
+                else:
+                    await interaction.response.send_message("Ошибка при удалении списка из базы данных.", ephemeral=True)
                 
-        except Exception as e:
-            await BotErrorHandler.handle(e, "confirm_delete", interaction)
+            except Exception as e:
+                await BotErrorHandler.handle(e, "confirm_delete", interaction)
 
     @discord.ui.button(label='Отмена', style=discord.ButtonStyle.secondary, emoji='❌')
     async def cancel_delete(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -288,77 +1299,101 @@ class DeleteConfirmView(discord.ui.View):
 
 
 # --- Контекстные меню (определяются вне класса) ---
+def cached_list(interaction: discord.Interaction, message_id: int):
+    """
+    Ищет список в индексе списков. Возвращает (сводка или None, известен ли ответ без БД):
+    для проиндексированного сервера отсутствие в индексе означает, что сообщение - не список.
+    """
+    cog = interaction.client.get_cog('CompositionCog')
+    if cog is None or not cog.list_index.is_indexed(interaction.guild_id):
+        return None, False
+    return cog.list_index.summary(message_id), True
+
+async def reply(interaction: discord.Interaction, *args, **kwargs):
+    """Отвечает сразу, если ответ ещё не отложен через defer, иначе - follow-up сообщением."""
+    if interaction.response.is_done():
+        await interaction.followup.send(*args, ephemeral=True, **kwargs)
+    else:
+        await interaction.response.send_message(*args, ephemeral=True, **kwargs)
+
 @app_commands.context_menu(name="Удалить список состава")
 @app_commands.default_permissions(administrator=True)
 async def delete_list_context(interaction: discord.Interaction, message: discord.Message):
-    try:
-        await interaction.response.defer(ephemeral=True)
-        
-        # Проверяем, является ли это сообщение списком состава
-        db_list = db_manager.get_list(message.id)
-        if not db_list:
-            await interaction.followup.send("Это сообщение не является списком состава.", ephemeral=True)
-            return
+    async with interaction.client.rest_scheduler.interactive():
+        try:
+            # Проверяем, является ли это сообщение списком состава; в БД идём только при промахе индекса
+            db_list, cached = cached_list(interaction, message.id)
+            if not cached:
+                await interaction.response.defer(ephemeral=True)
+                db_list = db_manager.get_list(message.id)
+            if not db_list:
+                await reply(interaction, "Это сообщение не является списком состава.")
+                return
         
-        # Проверяем права (список должен быть на этом сервере)
-        if db_list.guild_id != interaction.guild_id:
-            await interaction.followup.send("Ошибка: Этот список не принадлежит данному серверу.", ephemeral=True)
-            return
+            # Проверяем права (список должен быть на этом сервере)
+            if db_list.guild_id != interaction.guild_id:
+                await reply(interaction, "Ошибка: Этот список не принадлежит данному серверу.")
+                return
         
-        # Создаем подтверждающее embed
-        embed = discord.Embed(
-            title="⚠️ Подтверждение удаления",
-            description=f"Вы действительно хотите удалить список **'{db_list.title}'**?",
-            color=discord.Color.red()
-        )
+            # Создаем подтверждающее embed
+            embed = discord.Embed(
+                title="⚠️ Подтверждение удаления",
+                description=f"Вы действительно хотите удалить список **'{db_list.title}'**?",
+                color=discord.Color.red()
+            )
         
-        # Создаем кнопки подтверждения
-        view = DeleteConfirmView(db_list.message_id, db_list.title)
-        await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+            # Создаем кнопки подтверждения
+            view = DeleteConfirmView(db_list.message_id, db_list.title)
+            await reply(interaction, embed=embed, view=view)
 
-    except Exception as e:
-        await BotErrorHandler.handle(e, "delete_list_context", interaction)
+        except Exception as e:
+            await BotErrorHandler.handle(e, "delete_list_context", interaction)
 
 @app_commands.context_menu(name="Информация о списке")
 @app_commands.default_permissions(administrator=True)
 async def list_info_context(interaction: discord.Interaction, message: discord.Message):
-    try:
-        await interaction.response.defer(ephemeral=True)
-        
-        # Проверяем, является ли это сообщение списком состава
-        db_list = db_manager.get_list(message.id)
-        if not db_list:
-            await interaction.followup.send("Это сообщение не является списком состава.", ephemeral=True)
-            return
+    async with interaction.client.rest_scheduler.interactive():
+        try:
+            # Проверяем, является ли это сообщение списком состава; в БД идём только при промахе индекса
+            db_list, cached = cached_list(interaction, message.id)
+            if not cached:
+                await interaction.response.defer(ephemeral=True)
+                db_list = db_manager.get_list(message.id)
+            if not db_list:
+                await reply(interaction, "Это сообщение не является списком состава.")
+                return
         
-        embed = discord.Embed(
-            title=f"📋 Информация о списке",
-            color=discord.Color.blue()
-        )
+            embed = discord.Embed(
+                title=f"📋 Информация о списке",
+                color=discord.Color.blue()
+            )
         
-        embed.add_field(name="Название", value=db_list.title, inline=False)
-        embed.add_field(name="ID сообщения", value=f"`{db_list.message_id}`", inline=True)
-        embed.add_field(name="ID канала", value=f"`{db_list.channel_id}`", inline=True)
-        embed.add_field(name="Создан", value=db_list.created_at.strftime('%d.%m.%Y %H:%M') if db_list.created_at else 'Неизвестно', inline=True)
-        embed.add_field(name="Обновлен", value=db_list.updated_at.strftime('%d.%m.%Y %H:%M') if db_list.updated_at else 'Неизвестно', inline=True)
+            embed.add_field(name="Название", value=db_list.title, inline=False)
+            embed.add_field(name="ID сообщения", value=f"`{db_list.message_id}`", inline=True)
+            embed.add_field(name="ID канала", value=f"`{db_list.channel_id}`", inline=True)
+            embed.add_field(name="Создан", value=db_list.created_at.strftime('%d.%m.%Y %H:%M') if db_list.created_at else 'Неизвестно', inline=True)
+            embed.add_field(name="Обновлен", value=db_list.updated_at.strftime('%d.%m.%Y %H:%M') if db_list.updated_at else 'Неизвестно', inline=True)
         
-        # Информация о отслеживаемых ролях
-        roles_info = []
-        for role_id, section_data in db_list.sections.items():
-            role = interaction.guild.get_role(int(role_id))
-            status = "✅" if role else "❌"
-            roles_info.append(f"{status} {section_data['role_name']} (`{role_id}`)")
+            # Информация о отслеживаемых ролях (число участников берём из индекса ролей, без обхода сервера)
+            cog = interaction.client.get_cog('CompositionCog')
+            role_index = cog.role_index if cog and cog.role_index.is_built(interaction.guild_id) else None
+            roles_info = []
+            for role_id, section_data in db_list.sections.items():
+                role = interaction.guild.get_role(int(role_id))
+                status = "✅" if role else "❌"
+                count = f" - {len(role_index.members_of(interaction.guild_id, role_id))} уч." if role_index else ""
+                roles_info.append(f"{status} {section_data['role_name']} (`{role_id}`){count}")
         
-        embed.add_field(
-            name="Отслеживаемые роли",
-            value="\n".join(roles_info) if roles_info else "Нет ролей",
-            inline=False
-        )
+            embed.add_field(
+                name="Отслеживаемые роли",
+                value="\n".join(roles_info) if roles_info else "Нет ролей",
+                inline=False
+            )
         
-        await interaction.followup.send(embed=embed, ephemeral=True)
+            await reply(interaction, embed=embed)
 
-    except Exception as e:
-        await BotErrorHandler.handle(e, "list_info_context", interaction)
+        except Exception as e:
+            await BotErrorHandler.handle(e, "list_info_context", interaction)
 
 
 async def setup(bot: commands.Bot):
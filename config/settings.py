@@ -9,8 +9,55 @@ load_dotenv()
 TOKEN = os.getenv("DISCORD_TOKEN")
 
 # Настройки базы данных (используем SQLite)
-DATABASE_URL = "sqlite:///bot_data.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///bot_data.db")
+JSON_COMPRESS_THRESHOLD = 64 * 1024  # Байт; столбцы JSON длиннее сжимаются zlib (0 - не сжимать)
 
 # Настройки безопасности и производительности
 COMMAND_RATE_LIMIT = 10  # Команд в минуту на пользователя
-BATCH_UPDATE_DELAY = 5   # Секунд задержки для пакетного обновления ролей
\ No newline at end of file
+# Окно пакетной обработки: без работы batch_processor спит, с первым изменением открывается окно,
+# которое растёт от BATCH_INTERVAL_MIN до BATCH_INTERVAL_MAX с глубиной очереди и падением запаса лимитов REST
+BATCH_INTERVAL_MIN = 1       # Секунд при небольшой очереди и полном запасе лимитов
+BATCH_INTERVAL_MAX = 30      # Секунд при глубокой очереди или исчерпанных лимитах
+BATCH_DEEP_QUEUE = 2000      # Глубина очереди, при которой окно достигает максимума
+BATCH_HEADROOM_LOW = 0.5     # Доля оставшегося лимита правок, ниже которой окно удлиняется (при 0 - до максимума)
+RECONCILE_ON_STARTUP = True  # Пересобирать списки по текущим ролям, когда сервер становится доступен
+SHUTDOWN_TIMEOUT = 25    # Секунд на обработку очереди при SIGTERM/SIGINT; остаток сохраняется в БД до следующего запуска
+HANDOFF_EVENT_LIMIT = 10000  # Событий, копящихся во время перезагрузки кога; сверх них серверы пересобираются заново
+
+# Кеш участников
+MEMBER_CACHE_ENABLED = True  # False - участники не хранятся в памяти, роли берутся из индекса ролей
+RAW_MEMBER_UPDATES = True    # Разбирать GUILD_MEMBER_UPDATE напрямую, без построения объектов Member
+
+# Планировщик REST-запросов
+REST_BACKGROUND_RESERVE = 1      # Сколько запросов маршрута оставлять интерактивным командам
+REST_INTERACTIVE_RESERVE = 2     # Дополнительный запас маршрута, пока выполняются интерактивные команды
+REST_BACKGROUND_MAX_DELAY = 30   # Секунд, дольше которых фоновый запрос не ждёт и откладывается
+
+# Карантин списков, сообщения которых не удаётся править (нет прав и т.п.)
+LIST_QUARANTINE_BASE_DELAY = 60          # Секунд до первой повторной попытки
+LIST_QUARANTINE_MAX_DELAY = 6 * 60 * 60  # Верхняя граница экспоненциальной задержки
+
+# Метрики в формате Prometheus (HTTP-эндпоинт на event loop бота)
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"  # Только локальный доступ
+METRICS_PORT = 9108
+
+# Обработка ошибок
+ERROR_FINGERPRINT_LIMIT = 1000     # Различных ошибок в таблице счётчиков (вытесняются давно не встречавшиеся)
+ERROR_SAMPLE_INTERVAL = 60         # Секунд, в течение которых повторы одной ошибки не логируются и получают тот же ID
+ERROR_REPLY_COOLDOWN = 30          # Секунд между сообщениями об ошибке одному пользователю
+ERROR_REPORT_RETENTION_DAYS = 30   # Сколько дней хранить ошибки для поиска по ID
+
+# Логирование (запись и форматирование - в фоновом потоке QueueListener)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "json" - одна строка JSON на запись с полями guild_id, list_id, error_id
+LOG_FILE = os.getenv("LOG_FILE")              # Путь к файлу логов; не задан - только stderr
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024         # Размер файла, после которого он ротируется
+LOG_FILE_BACKUP_COUNT = 5                     # Сколько старых файлов хранить
+
+# Мониторинг event loop
+LOOP_LAG_MONITOR_ENABLED = True
+LOOP_LAG_INTERVAL = 0.5          # Секунд между замерами задержки
+LOOP_LAG_WARN_THRESHOLD = 0.25   # Задержка (сек), при которой пишем предупреждение
+SLOW_CALLBACK_TRACER_ENABLED = False
+SLOW_CALLBACK_THRESHOLD = 0.1    # Шаг event loop дольше этого (сек) логируется со стеком
@@ -0,0 +1,134 @@
+# project/loadtest/fake_discord.py
+
+import random
+
+
+class FakeRole:
+    """Роль с минимальным набором атрибутов, которые использует CompositionCog."""
+    __slots__ = ('id', 'name', 'position')
+
+    def __init__(self, id: int, name: str, position: int):
+        self.id = id
+        self.name = name
+        self.position = position
+
+    def __repr__(self):
+        return f"<FakeRole id={self.id} name={self.name!r} position={self.position}>"
+
+
+class FakeMember:
+    """Участник сервера: ID, упоминание и список ролей."""
+    __slots__ = ('id', 'guild', 'roles')
+
+    def __init__(self, id: int, guild, roles):
+        self.id = id
+        self.guild = guild
+        self.roles = roles
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+    def get_role(self, role_id: int):
+        for role in self.roles:
+            if role.id == role_id:
+                return role
+        return None
+
+    def copy(self):
+        return FakeMember(self.id, self.guild, list(self.roles))
+
+
+class FakeGuild:
+    """
+    Сервер с ролями и участниками.
+    fetch_members ходит в REST-заглушку постранично, как настоящий Guild.fetch_members.
+    """
+    def __init__(self, id: int, http=None):
+        self.id = id
+        self.name = f"guild-{id}"
+        self.chunked = True
+        self.http = http
+        self.tracked_roles = []  # Роли, по которым создаются списки
+        self._roles = {}
+        self._members = {}
+
+    @property
+    def roles(self):
+        return sorted(self._roles.values(), key=lambda role: role.position)
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    @property
+    def member_count(self):
+        return len(self._members)
+
+    def get_role(self, role_id: int):
+        return self._roles.get(role_id)
+
+    def get_member(self, member_id: int):
+        return self._members.get(member_id)
+
+    def add_role(self, role: FakeRole):
+        self._roles[role.id] = role
+
+    def add_member(self, member: FakeMember):
+        self._members[member.id] = member
+
+    async def fetch_members(self, *, limit=1000, after=None):
+        after_id = None
+        while True:
+            page = await self.http.get_members(self.id, 1000, after_id)
+            for data in page:
+                member = self._members.get(int(data['user']['id']))
+                if member is not None:
+                    yield member
+            if len(page) < 1000:
+                return
+            after_id = int(page[-1]['user']['id'])
+
+
+class FakeWorld:
+    """Набор серверов, общий для генератора событий и REST-заглушки."""
+    def __init__(self, seed: int = 0):
+        self.random = random.Random(seed)
+        self.guilds = {}
+        self._next_id = 100_000_000_000_000_000
+
+    def snowflake(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def build_guild(self, members: int, tracked_roles: int, untracked_roles: int, http=None) -> FakeGuild:
+        """Создаёт сервер, где у каждого участника случайное подмножество ролей."""
+        guild = FakeGuild(self.snowflake(), http)
+        everyone = FakeRole(guild.id, '@everyone', 0)
+        guild.add_role(everyone)
+
+        positions = list(range(1, tracked_roles + untracked_roles + 1))
+        self.random.shuffle(positions)
+        for i in range(tracked_roles + untracked_roles):
+            role = FakeRole(self.snowflake(), f"role-{i}", positions[i])
+            guild.add_role(role)
+            if i < tracked_roles:
+                guild.tracked_roles.append(role)
+
+        all_roles = [role for role in guild.roles if role is not everyone]
+        for _ in range(members):
+            count = self.random.randint(0, min(3, len(all_roles)))
+            roles = [everyone] + sorted(self.random.sample(all_roles, count), key=lambda role: role.position)
+            guild.add_member(FakeMember(self.snowflake(), guild, roles))
+
+        self.guilds[guild.id] = guild
+        return guild
+
+    def member_payload(self, member: FakeMember) -> dict:
+        return {
+            'user': {'id': str(member.id), 'username': f"user{member.id}", 'discriminator': '0', 'avatar': None},
+            'roles': [str(role.id) for role in member.roles if role.id != member.guild.id],
+            'joined_at': None,
+            'deaf': False,
+            'mute': False,
+        }
@@ -0,0 +1,232 @@
+# project/loadtest/rest_standin.py
+
+import asyncio
+import bisect
+import datetime
+import json
+import time
+from collections import Counter
+
+from aiohttp import web
+
+from utils.rest_scheduler import route_key
+
+MESSAGE_CHAR_LIMIT = 2000  # Как у Discord: более длинный content отклоняется с 400 (50035)
+
+
+def _now_iso() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def _json(body, *, status: int = 200, headers=None) -> web.Response:
+    # discord.py разбирает JSON только при Content-Type ровно 'application/json' (без charset)
+    return web.Response(body=json.dumps(body).encode('utf-8'), status=status, headers={**(headers or {}), 'Content-Type': 'application/json'})
+
+
+class Bucket:
+    """Окно лимита в стиле Discord: limit запросов за window секунд."""
+    __slots__ = ('limit', 'window', 'remaining', 'reset_at')
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def take(self, now: float) -> bool:
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.window
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+    def headers(self, now: float, bucket_hash: str) -> dict:
+        reset_after = max(self.reset_at - now, 0.0)
+        return {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(self.remaining),
+            'X-RateLimit-Reset': f"{time.time() + reset_after:.3f}",
+            'X-RateLimit-Reset-After': f"{reset_after:.3f}",
+            'X-RateLimit-Bucket': bucket_hash,
+        }
+
+
+class RestStandIn:
+    """
+    Локальная замена REST API Discord для нагрузочного теста.
+    Поддерживает маршруты логина, каналов, сообщений и участников, отдаёт заголовки лимитов и 429.
+    """
+    def __init__(self, world, *, latency: float = 0.05, message_limit: int = 5, message_window: float = 5.0):
+        self.world = world
+        self.latency = latency
+        self.message_limit = message_limit
+        self.message_window = message_window
+        self.messages = {}  # {message_id: {'channel_id': ..., 'guild_id': ..., 'content': ...}}
+        self.channels = {}  # {channel_id: guild_id}
+        self.calls = Counter()  # {(route, status): count}
+        self.on_edit = None  # callback(message_id, content, timestamp)
+        self._buckets = {}
+        self._member_ids = {}  # {guild_id: [member_id, ...]} - отсортированные ID для пагинации
+        self._runner = None
+        self.base_url = None
+
+    # --- Данные ---
+    def add_channel(self, guild_id: int) -> int:
+        channel_id = self.world.snowflake()
+        self.channels[channel_id] = guild_id
+        return channel_id
+
+    def add_message(self, channel_id: int, content: str = '') -> int:
+        message_id = self.world.snowflake()
+        self.messages[message_id] = {'channel_id': channel_id, 'guild_id': self.channels[channel_id], 'content': content}
+        return message_id
+
+    # --- Сервер ---
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get('/api/v10/users/@me', self._get_me)
+        app.router.add_get('/api/v10/oauth2/applications/@me', self._get_application)
+        app.router.add_get('/api/v10/channels/{channel_id}', self._get_channel)
+        app.router.add_post('/api/v10/channels/{channel_id}/messages', self._create_message)
+        app.router.add_get('/api/v10/channels/{channel_id}/messages/{message_id}', self._get_message)
+        app.router.add_patch('/api/v10/channels/{channel_id}/messages/{message_id}', self._edit_message)
+        app.router.add_delete('/api/v10/channels/{channel_id}/messages/{message_id}', self._delete_message)
+        app.router.add_get('/api/v10/guilds/{guild_id}/members', self._get_members)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{bound_port}/api/v10"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        route = route_key(request.method, request.path)
+        response = await handler(request)
+        self.calls[(route, response.status)] += 1
+        return response
+
+    def _limited(self, route: str, bucket_hash: str, limit: int, window: float):
+        """Проверяет лимит маршрута; возвращает (ответ 429 или None, заголовки лимита)."""
+        now = time.monotonic()
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            bucket = self._buckets[route] = Bucket(limit, window)
+        if bucket.take(now):
+            return None, bucket.headers(now, bucket_hash)
+
+        retry_after = max(bucket.reset_at - now, 0.0)
+        headers = bucket.headers(now, bucket_hash)
+        headers.update({'Retry-After': f"{retry_after:.3f}", 'X-RateLimit-Scope': 'user', 'Via': '1.1 google'})
+        body = {'message': 'You are being rate limited.', 'retry_after': retry_after, 'global': False}
+        return _json(body, status=429, headers=headers), headers
+
+    # --- Полезные нагрузки ---
+    @staticmethod
+    def _user(user_id: int, name: str) -> dict:
+        return {'id': str(user_id), 'username': name, 'discriminator': '0', 'avatar': None, 'global_name': None, 'bot': True}
+
+    def _message_payload(self, message_id: int) -> dict:
+        message = self.messages[message_id]
+        return {
+            'id': str(message_id),
+            'channel_id': str(message['channel_id']),
+            'author': self._user(1, 'harness-bot'),
+            'content': message['content'],
+            'timestamp': _now_iso(),
+            'edited_timestamp': _now_iso(),
+            'tts': False,
+            'mention_everyone': False,
+            'mentions': [],
+            'mention_roles': [],
+            'attachments': [],
+            'embeds': [],
+            'pinned': False,
+            'type': 0,
+            'flags': 0,
+            'components': [],
+        }
+
+    @staticmethod
+    def _not_found(code: int = 10008) -> web.Response:
+        return _json({'message': 'Unknown Message', 'code': code}, status=404)
+
+    # --- Обработчики ---
+    async def _get_me(self, request):
+        return _json(self._user(1, 'harness-bot'))
+
+    async def _get_application(self, request):
+        return _json({
+            'id': '1', 'name': 'harness', 'description': '', 'icon': None,
+            'bot_public': False, 'bot_require_code_grant': False, 'verify_key': '',
+            'owner': self._user(2, 'owner'), 'flags': 0,
+        })
+
+    async def _get_channel(self, request):
+        channel_id = int(request.match_info['channel_id'])
+        if channel_id not in self.channels:
+            return self._not_found(10003)
+        return _json({
+            'id': str(channel_id), 'type': 0, 'guild_id': str(self.channels[channel_id]),
+            'name': f"channel-{channel_id}", 'position': 0, 'permission_overwrites': [], 'nsfw': False,
+        })
+
+    async def _create_message(self, request):
+        channel_id = int(request.match_info['channel_id'])
+        if channel_id not in self.channels:
+            return self._not_found(10003)
+        data = await request.json()
+        message_id = self.add_message(channel_id, data.get('content', ''))
+        return _json(self._message_payload(message_id))
+
+    async def _get_message(self, request):
+        message_id = int(request.match_info['message_id'])
+        if message_id not in self.messages:
+            return self._not_found()
+        return _json(self._message_payload(message_id))
+
+    async def _edit_message(self, request):
+        message_id = int(request.match_info['message_id'])
+        route = route_key(request.method, request.path)
+        limited, headers = self._limited(route, 'standin-message-edit', self.message_limit, self.message_window)
+        if limited is not None:
+            return limited
+        if message_id not in self.messages:
+            return self._not_found()
+
+        data = await request.json()
+        if len(data.get('content', '')) > MESSAGE_CHAR_LIMIT:
+            return _json({'message': 'Invalid Form Body', 'code': 50035}, status=400, headers=headers)
+        self.messages[message_id]['content'] = data.get('content', '')
+        if self.on_edit:
+            self.on_edit(message_id, self.messages[message_id]['content'], time.perf_counter())
+        return _json(self._message_payload(message_id), headers=headers)
+
+    async def _delete_message(self, request):
+        message_id = int(request.match_info['message_id'])
+        if self.messages.pop(message_id, None) is None:
+            return self._not_found()
+        return web.Response(status=204)
+
+    async def _get_members(self, request):
+        guild = self.world.guilds.get(int(request.match_info['guild_id']))
+        if guild is None:
+            return self._not_found(10004)
+        limit = int(request.query.get('limit', 1))
+        after = int(request.query.get('after', 0))
+        member_ids = self._member_ids.get(guild.id)
+        if member_ids is None:
+            member_ids = self._member_ids[guild.id] = sorted(member.id for member in guild.members)
+        start = bisect.bisect_right(member_ids, after)
+        page = [guild.get_member(member_id) for member_id in member_ids[start:start + limit]]
+        return _json([self.world.member_payload(member) for member in page])
@@ -0,0 +1,267 @@
+# project/loadtest/run.py
+"""
+Нагрузочный тест CompositionCog без живого Discord.
+
+Поднимает локальную REST-заглушку, направляет в неё HTTP-клиент discord.py,
+создаёт синтетические серверы со списками и генерирует события on_member_update.
+
+Запуск из корня проекта:
+    python -m loadtest.run --guilds 2 --members 5000 --lists 3 --rate 50 --duration 30
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import tempfile
+import time
+
+# База для теста создаётся во временном файле до импорта модулей бота
+_DB_DIR = tempfile.mkdtemp(prefix='composition-loadtest-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_DB_DIR, 'loadtest.db')}")
+
+import discord
+from discord.ext import commands
+
+from cogs.composition import CompositionCog
+from loadtest.fake_discord import FakeWorld
+from loadtest.rest_standin import RestStandIn
+from utils import metrics
+from utils.data_manager import db_manager
+from utils.rest_scheduler import RestScheduler
+
+_HEADER = re.compile(r'^\*\*(.+)\*\*:$')
+_USER = re.compile(r'^\s+• (<@\d+>)$')
+
+
+def parse_content(content: str) -> dict:
+    """Разбирает текст списка в {mention: header}."""
+    placements = {}
+    header = None
+    for line in content.splitlines():
+        match = _HEADER.match(line)
+        if match:
+            header = match.group(1)
+            continue
+        match = _USER.match(line)
+        if match and header is not None:
+            placements[match.group(1)] = header
+    return placements
+
+
+class LatencyTracker:
+    """Сопоставляет события изменения ролей с правками сообщений, в которых они стали видны."""
+    def __init__(self):
+        self.lists = {}       # {message_id: (guild_id, {role_id: header})}
+        self.placements = {}  # {message_id: {mention: header}} - что сейчас показано
+        self.pending = {}     # {message_id: {mention: (event_ts, expected_header)}}
+        self.latencies = []
+        self.edits = 0
+
+    def add_list(self, message_id: int, guild_id: int, sections: dict):
+        self.lists[message_id] = (guild_id, {int(role_id): data['header'] for role_id, data in sections.items()})
+        self.placements[message_id] = {}
+        self.pending[message_id] = {}
+
+    def record_event(self, member, lists, timestamp: float):
+        """Запоминает, в какой секции каждого списка участник должен оказаться."""
+        for message_id in lists:
+            _, headers = self.lists[message_id]
+            expected = None
+            for role in sorted(member.roles, key=lambda role: role.position, reverse=True):
+                if role.id in headers:
+                    expected = headers[role.id]
+                    break
+            pending = self.pending[message_id]
+            if self.placements[message_id].get(member.mention) == expected:
+                pending.pop(member.mention, None)
+                continue
+            first_ts = pending[member.mention][0] if member.mention in pending else timestamp
+            pending[member.mention] = (first_ts, expected)
+
+    def on_edit(self, message_id: int, content: str, timestamp: float):
+        if message_id not in self.lists:
+            return
+        self.edits += 1
+        placements = self.placements[message_id] = parse_content(content)
+        pending = self.pending[message_id]
+        for mention, (event_ts, expected) in list(pending.items()):
+            if placements.get(mention) == expected:
+                self.latencies.append(timestamp - event_ts)
+                del pending[mention]
+
+    @property
+    def outstanding(self) -> int:
+        return sum(len(pending) for pending in self.pending.values())
+
+
+class HarnessBot(commands.Bot):
+    """Бот без подключения к шлюзу: серверы берутся из FakeWorld."""
+    def __init__(self, world: FakeWorld):
+        rest_scheduler = RestScheduler()
+        super().__init__(command_prefix='!', intents=discord.Intents.none(), http_trace=rest_scheduler.trace_config())
+        self.rest_scheduler = rest_scheduler
+        self.db = db_manager
+        self.world = world
+
+    def get_guild(self, guild_id: int, /):
+        return self.world.guilds.get(guild_id)
+
+    async def setup_hook(self):
+        await self.add_cog(CompositionCog(self))
+
+
+async def generate_events(cog, world, tracker, lists_by_guild, rate: float, duration: float) -> int:
+    """
+    Генерирует rate событий в секунду: участник получает или теряет случайную отслеживаемую роль.
+    Если установлен raw-обработчик, событие проходит через парсер GUILD_MEMBER_UPDATE, как от шлюза.
+    """
+    parse_member_update = cog.bot._connection.parsers['GUILD_MEMBER_UPDATE']
+    loop = asyncio.get_running_loop()
+    rng = world.random
+    guilds = list(world.guilds.values())
+    members = {guild.id: guild.members for guild in guilds}
+    started = loop.time()
+    sent = 0
+
+    while loop.time() - started < duration:
+        due = int((loop.time() - started) * rate) - sent
+        for _ in range(due):
+            guild = rng.choice(guilds)
+            member = rng.choice(members[guild.id])
+            role = rng.choice(guild.tracked_roles)
+
+            before = member.copy()
+            if member.get_role(role.id):
+                member.roles.remove(role)
+            else:
+                member.roles.append(role)
+                member.roles.sort(key=lambda r: r.position)
+
+            tracker.record_event(member, lists_by_guild[guild.id], time.perf_counter())
+            if cog.raw_member_hook.installed:
+                parse_member_update({
+                    'guild_id': str(guild.id),
+                    'user': {'id': str(member.id)},
+                    'roles': [str(role.id) for role in member.roles],
+                })
+            await cog.on_member_update(before, member)
+            sent += 1
+        await asyncio.sleep(0.01)
+    return sent
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+async def run(args) -> dict:
+    world = FakeWorld(args.seed)
+    standin = RestStandIn(world, latency=args.rest_latency / 1000, message_limit=args.edit_limit, message_window=args.edit_window)
+    discord.http.Route.BASE = await standin.start()
+
+    bot = HarnessBot(world)
+    tracker = LatencyTracker()
+    standin.on_edit = tracker.on_edit
+
+    try:
+        await bot.login('loadtest-token')
+        cog = bot.get_cog('CompositionCog')
+
+        lists_by_guild = {}
+        for _ in range(args.guilds):
+            guild = world.build_guild(args.members, args.roles, args.untracked_roles, http=bot.http)
+            lists_by_guild[guild.id] = []
+            for index in range(args.lists):
+                roles = world.random.sample(guild.tracked_roles, min(args.list_roles or args.roles, args.roles))
+                sections = {str(role.id): {'header': role.name, 'role_name': role.name, 'position': role.position} for role in roles}
+                channel_id = standin.add_channel(guild.id)
+                message_id = standin.add_message(channel_id)
+                db_manager.add_list(message_id, channel_id, guild.id, f"Список {index}", sections)
+                tracker.add_list(message_id, guild.id, sections)
+                lists_by_guild[guild.id].append(message_id)
+            await cog.index_guild(guild)
+
+        standin.calls.clear()
+        started = time.perf_counter()
+        events = await generate_events(cog, world, tracker, lists_by_guild, args.rate, args.duration)
+
+        # Ждём, пока очередь разберётся и все изменения станут видны
+        deadline = time.perf_counter() + args.drain
+        while time.perf_counter() < deadline and (tracker.outstanding or cog.update_queue or cog.pending_renders):
+            await asyncio.sleep(0.1)
+        elapsed = time.perf_counter() - started
+    finally:
+        await bot.close()
+        await standin.stop()
+
+    api_calls = sum(standin.calls.values())
+    latencies = tracker.latencies
+    return {
+        'config': vars(args),
+        'events': events,
+        'list_updates': len(latencies),
+        'undelivered': tracker.outstanding,
+        'elapsed_s': round(elapsed, 3),
+        'events_per_s': round(events / elapsed, 2) if elapsed else 0.0,
+        'list_updates_per_s': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'edits': tracker.edits,
+        'api_calls': api_calls,
+        'api_calls_per_change': round(api_calls / events, 3) if events else 0.0,
+        'rate_limited': sum(count for (_, status), count in standin.calls.items() if status == 429),
+        'latency_s': {
+            'mean': round(statistics.fmean(latencies), 3) if latencies else None,
+            'p50': round(percentile(latencies, 0.50), 3),
+            'p95': round(percentile(latencies, 0.95), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+            'max': round(max(latencies), 3) if latencies else None,
+        },
+        'calls_by_route': {f"{route} {status}": count for (route, status), count in sorted(standin.calls.items())},
+        'list_edits': {key[0]: value for key, value in metrics.list_edits._values.items()},
+    }
+
+
+def print_report(report: dict):
+    latency = report['latency_s']
+    print(f"События:            {report['events']} ({report['events_per_s']}/с)")
+    print(f"Обновления списков: {report['list_updates']} ({report['list_updates_per_s']}/с), не доставлено {report['undelivered']}")
+    print(f"Время:              {report['elapsed_s']} с")
+    print(f"Задержка (с):       mean={latency['mean']} p50={latency['p50']} p95={latency['p95']} p99={latency['p99']} max={latency['max']}")
+    print(f"Правок сообщений:   {report['edits']}")
+    print(f"REST-вызовов:       {report['api_calls']} ({report['api_calls_per_change']} на изменение, 429: {report['rate_limited']})")
+    for route, count in report['calls_by_route'].items():
+        print(f"  {route}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест CompositionCog с имитацией Discord.")
+    parser.add_argument('--guilds', type=int, default=1, help="Количество серверов")
+    parser.add_argument('--members', type=int, default=1000, help="Участников на сервере")
+    parser.add_argument('--roles', type=int, default=5, help="Отслеживаемых ролей на сервере")
+    parser.add_argument('--untracked-roles', type=int, default=10, help="Прочих ролей на сервере")
+    parser.add_argument('--lists', type=int, default=2, help="Списков на сервере")
+    parser.add_argument('--list-roles', type=int, default=0, help="Ролей в каждом списке (0 - все отслеживаемые)")
+    parser.add_argument('--rate', type=float, default=20.0, help="Событий изменения ролей в секунду")
+    parser.add_argument('--duration', type=float, default=20.0, help="Длительность генерации событий, с")
+    parser.add_argument('--drain', type=float, default=60.0, help="Сколько ждать доставки после генерации, с")
+    parser.add_argument('--rest-latency', type=float, default=50.0, help="Задержка ответа REST-заглушки, мс")
+    parser.add_argument('--edit-limit', type=int, default=5, help="Правок сообщений на канал за окно лимита")
+    parser.add_argument('--edit-window', type=float, default=5.0, help="Окно лимита правок, с")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Сохранить отчёт в JSON-файл")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
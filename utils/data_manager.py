@@ -1,11 +1,15 @@
 # project/utils/data_manager.py
 
 import datetime
-from sqlalchemy import create_engine, Column, Integer, String, JSON, DateTime
+import functools
+from types import MappingProxyType
+from sqlalchemy import create_engine, Column, Index, Integer, String, Text, DateTime, bindparam, select
 from sqlalchemy.orm import sessionmaker, declarative_base
 from contextlib import contextmanager
 
 from config.settings import DATABASE_URL
+from utils import metrics
+from utils.json_column import CompactJSON
 
 Base = declarative_base()
 
@@ -14,25 +18,78 @@ class CompositionList(Base):
     __tablename__ = 'composition_lists'
     
     message_id = Column(Integer, primary_key=True)
-    channel_id = Column(Integer, nullable=False)
+    channel_id = Column(Integer, nullable=False, index=True)
     guild_id = Column(Integer, nullable=False, index=True)
     title = Column(String(200), nullable=False)
-    sections = Column(JSON, nullable=False) # {'role_id': {'header': '...', 'role_name': '...'}}
-    current_users = Column(JSON, nullable=False) # {'role_id': ['user_mention', ...]}
+    sections = Column(CompactJSON, nullable=False) # {'role_id': {'header': '...', 'role_name': '...'}}
+    current_users = Column(CompactJSON, nullable=False) # {'role_id': ['user_mention', ...]}
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
+    # Постраничный просмотр списков сервера идёт по ключу (guild_id, message_id)
+    __table_args__ = (Index('ix_composition_lists_guild_message', 'guild_id', 'message_id'),)
+
+class ErrorReport(Base):
+    """Ошибка, ID которой показан пользователю: по нему администратор находит подробности."""
+    __tablename__ = 'error_reports'
+
+    error_id = Column(String(8), primary_key=True)
+    fingerprint = Column(String(16), nullable=False, index=True)
+    context = Column(String(200), nullable=False)
+    error_type = Column(String(200), nullable=False)
+    message = Column(String(500), nullable=False)
+    traceback = Column(Text)
+    guild_id = Column(Integer, index=True)
+    user_id = Column(Integer)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+class PendingWork(Base):
+    """Необработанная работа пакетной обработки, сохранённая при остановке бота."""
+    __tablename__ = 'pending_work'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(16), nullable=False)  # 'member', 'departed', 'render', 'stale'
+    guild_id = Column(Integer)
+    target_id = Column(Integer, nullable=False)  # ID участника или сообщения списка
+
+def freeze_sections(sections) -> MappingProxyType:
+    """{role_id: {...}} -> неизменяемое отображение неизменяемых секций."""
+    return MappingProxyType({role_id: MappingProxyType(dict(section_data)) for role_id, section_data in sections.items()})
+
+def freeze_users(current_users) -> MappingProxyType:
+    """{role_id: [mention, ...]} -> неизменяемое отображение кортежей. Готовые кортежи не копируются."""
+    return MappingProxyType({role_id: tuple(users) for role_id, users in current_users.items()})
+
 class CompositionListData:
-    """Простой класс для хранения данных без привязки к SQLAlchemy сессии."""
+    """
+    Неизменяемый снимок списка без привязки к SQLAlchemy сессии.
+    Состав хранится кортежами по секциям: replace() создаёт новый снимок, который разделяет
+    с прежним все неизменённые секции, поэтому правка не копирует весь состав и не портит другие снимки.
+    """
+    __slots__ = ('message_id', 'channel_id', 'guild_id', 'title', 'sections', 'current_users', 'created_at', 'updated_at')
+
     def __init__(self, message_id, channel_id, guild_id, title, sections, current_users, created_at=None, updated_at=None):
-        self.message_id = message_id
-        self.channel_id = channel_id
-        self.guild_id = guild_id
-        self.title = title
-        self.sections = sections
-        self.current_users = current_users
-        self.created_at = created_at
-        self.updated_at = updated_at
+        init = object.__setattr__
+        init(self, 'message_id', message_id)
+        init(self, 'channel_id', channel_id)
+        init(self, 'guild_id', guild_id)
+        init(self, 'title', title)
+        init(self, 'sections', freeze_sections(sections))
+        init(self, 'current_users', freeze_users(current_users))
+        init(self, 'created_at', created_at)
+        init(self, 'updated_at', updated_at)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"CompositionListData неизменяем, используйте replace(): {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"CompositionListData неизменяем: {name}")
+
+    def replace(self, **changes):
+        """Новый снимок с изменёнными полями."""
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return CompositionListData(**fields)
     
     @classmethod
     def from_db_object(cls, db_obj):
@@ -48,6 +105,54 @@ class CompositionListData:
             updated_at=db_obj.updated_at
         )
 
+# --- Горячий путь на SQLAlchemy Core ---
+# Операторы строятся один раз, их компиляция кешируется движком.
+# Столбцы выбираются в порядке аргументов CompositionListData, строка передаётся в него без ORM-объекта.
+_lists = CompositionList.__table__
+_LIST_COLUMNS = (
+    _lists.c.message_id, _lists.c.channel_id, _lists.c.guild_id, _lists.c.title,
+    _lists.c.sections, _lists.c.current_users, _lists.c.created_at, _lists.c.updated_at,
+)
+_SELECT_LIST = select(*_LIST_COLUMNS).where(_lists.c.message_id == bindparam('target_message_id'))
+_SELECT_GUILD_LISTS = select(*_LIST_COLUMNS).where(_lists.c.guild_id == bindparam('target_guild_id'))
+# SET формируется из ключей параметров; updated_at проставляется через onupdate столбца
+_UPDATE_LIST = _lists.update().where(_lists.c.message_id == bindparam('target_message_id'))
+# Страница списков без столбцов JSON: только то, что показывается в /показатьсписки
+_PAGE_COLUMNS = (_lists.c.message_id, _lists.c.channel_id, _lists.c.title, _lists.c.created_at)
+_PAGE_AFTER = (
+    select(*_PAGE_COLUMNS)
+    .where(_lists.c.guild_id == bindparam('target_guild_id'), _lists.c.message_id > bindparam('after_id'))
+    .order_by(_lists.c.message_id)
+    .limit(bindparam('page_limit'))
+)
+_PAGE_BEFORE = (
+    select(*_PAGE_COLUMNS)
+    .where(_lists.c.guild_id == bindparam('target_guild_id'), _lists.c.message_id < bindparam('before_id'))
+    .order_by(_lists.c.message_id.desc())
+    .limit(bindparam('page_limit'))
+)
+
+_reports = ErrorReport.__table__
+_SELECT_REPORT = select(_reports).where(_reports.c.error_id == bindparam('target_error_id'))
+_PRUNE_REPORTS = _reports.delete().where(_reports.c.created_at < bindparam('cutoff'))
+_pending = PendingWork.__table__
+
+def _json_sections(sections) -> dict:
+    """Секции (в т.ч. замороженные) в обычные dict для столбца JSON."""
+    return {role_id: dict(section_data) for role_id, section_data in sections.items()}
+
+def _json_users(current_users) -> dict:
+    """Кортежи json сериализует как массивы, поэтому достаточно верхнего dict."""
+    return dict(current_users)
+
+def timed(method):
+    """Записывает время выполнения метода DatabaseManager в метрики."""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with metrics.db_query_duration.time(method=method.__name__):
+            return method(*args, **kwargs)
+    return wrapper
+
 class DatabaseManager:
     """Класс для централизованного управления сессиями и операциями с БД."""
     def __init__(self, db_url):
@@ -68,51 +173,74 @@ class DatabaseManager:
         finally:
             session.close()
 
+    @timed
     def get_list(self, message_id: int):
         """Возвращает CompositionListData объект, не привязанный к сессии."""
-        with self.session_scope() as session:
-            db_obj = session.query(CompositionList).filter_by(message_id=message_id).first()
-            if db_obj:
-                return CompositionListData.from_db_object(db_obj)
-            return None
+        with self.engine.connect() as connection:
+            row = connection.execute(_SELECT_LIST, {'target_message_id': message_id}).first()
+        return CompositionListData(*row) if row else None
 
+    @timed
     def get_lists_for_guild(self, guild_id: int):
         """Возвращает список CompositionListData объектов, не привязанных к сессии."""
-        with self.session_scope() as session:
-            db_objects = session.query(CompositionList).filter_by(guild_id=guild_id).all()
-            return [CompositionListData.from_db_object(db_obj) for db_obj in db_objects]
+        with self.engine.connect() as connection:
+            rows = connection.execute(_SELECT_GUILD_LISTS, {'target_guild_id': guild_id}).all()
+        return [CompositionListData(*row) for row in rows]
 
-    def add_list(self, message_id, channel_id, guild_id, title, sections):
-        """Добавляет новый список и возвращает его message_id."""
+    @timed
+    def get_list_page(self, guild_id: int, limit: int, after: int = 0, before: int = None):
+        """
+        Страница списков сервера (message_id, channel_id, title, created_at) по возрастанию message_id.
+        after - ключ последней строки предыдущей страницы, before - первой строки следующей.
+        Возвращает (строки, есть ли ещё строки в направлении запроса).
+        """
+        with self.engine.connect() as connection:
+            if before is not None:
+                rows = connection.execute(_PAGE_BEFORE, {'target_guild_id': guild_id, 'before_id': before, 'page_limit': limit + 1}).all()
+            else:
+                rows = connection.execute(_PAGE_AFTER, {'target_guild_id': guild_id, 'after_id': after, 'page_limit': limit + 1}).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if before is not None:
+            rows.reverse()
+        return rows, has_more
+
+    @timed
+    def add_list(self, message_id, channel_id, guild_id, title, sections, current_users=None):
+        """Добавляет новый список (при необходимости сразу с составом) и возвращает его message_id."""
         with self.session_scope() as session:
-            initial_users = {role_id: [] for role_id in sections.keys()}
+            initial_users = current_users if current_users is not None else {role_id: [] for role_id in sections.keys()}
             new_list = CompositionList(
                 message_id=message_id,
                 channel_id=channel_id,
                 guild_id=guild_id,
                 title=title,
-                sections=sections,
-                current_users=initial_users
+                sections=_json_sections(sections),
+                current_users=_json_users(initial_users)
             )
             session.add(new_list)
             session.flush()  # Получаем ID до коммита
             return new_list.message_id
 
+    @timed
     def update_list_content(self, message_id: int, new_sections=None, new_users=None, new_title=None):
-        """Обновляет содержимое списка."""
-        with self.session_scope() as session:
-            db_list = session.query(CompositionList).filter_by(message_id=message_id).first()
-            if db_list:
-                if new_sections is not None:
-                    db_list.sections = new_sections
-                if new_users is not None:
-                    db_list.current_users = new_users
-                if new_title is not None:
-                    db_list.title = new_title
-                # updated_at обновится автоматически
-                return True
-            return False
+        """Обновляет содержимое списка одним UPDATE без предварительного SELECT."""
+        values = {}
+        if new_sections is not None:
+            values['sections'] = _json_sections(new_sections)
+        if new_users is not None:
+            values['current_users'] = _json_users(new_users)
+        if new_title is not None:
+            values['title'] = new_title
+        if not values:
+            return self.get_list(message_id) is not None
 
+        with self.engine.begin() as connection:
+            # updated_at обновится автоматически
+            result = connection.execute(_UPDATE_LIST, {'target_message_id': message_id, **values})
+        return result.rowcount > 0
+
+    @timed
     def delete_list(self, message_id: int):
         """Удаляет список из базы данных."""
         with self.session_scope() as session:
@@ -122,5 +250,62 @@ class DatabaseManager:
                 return True
             return False
 
+    @timed
+    def delete_lists(self, message_ids):
+        """Удаляет несколько списков одним запросом и возвращает число удалённых."""
+        if not message_ids:
+            return 0
+        with self.session_scope() as session:
+            return session.query(CompositionList).filter(
+                CompositionList.message_id.in_(list(message_ids))
+            ).delete(synchronize_session=False)
+
+    @timed
+    def add_error_report(self, error_id: str, fingerprint: str, context: str, error_type: str, message: str,
+                         traceback: str = None, guild_id: int = None, user_id: int = None, retention_days: int = 30):
+        """Сохраняет ошибку для поиска по ID и удаляет записи старше retention_days."""
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
+        with self.engine.begin() as connection:
+            connection.execute(_PRUNE_REPORTS, {'cutoff': cutoff})
+            connection.execute(_reports.insert(), {
+                'error_id': error_id,
+                'fingerprint': fingerprint,
+                'context': context[:200],
+                'error_type': error_type[:200],
+                'message': message[:500],
+                'traceback': traceback,
+                'guild_id': guild_id,
+                'user_id': user_id,
+                'created_at': datetime.datetime.utcnow(),
+            })
+
+    @timed
+    def get_error_report(self, error_id: str):
+        """Возвращает строку ErrorReport по ID ошибки или None."""
+        with self.engine.connect() as connection:
+            return connection.execute(_SELECT_REPORT, {'target_error_id': error_id}).first()
+
+    @timed
+    def save_pending_work(self, items):
+        """Сохраняет [(kind, guild_id, target_id), ...] одним INSERT."""
+        if not items:
+            return
+        with self.engine.begin() as connection:
+            connection.execute(_pending.insert(), [
+                {'kind': kind, 'guild_id': guild_id, 'target_id': target_id} for kind, guild_id, target_id in items
+            ])
+
+    @timed
+    def take_pending_work(self):
+        """Забирает сохранённую работу и очищает таблицу в одной транзакции."""
+        with self.engine.begin() as connection:
+            rows = connection.execute(select(_pending.c.kind, _pending.c.guild_id, _pending.c.target_id)).all()
+            connection.execute(_pending.delete())
+        return rows
+
+    def close(self):
+        """Закрывает соединения пула. Все записи к этому моменту уже зафиксированы."""
+        self.engine.dispose()
+
 # Создаем единственный экземпляр менеджера
 db_manager = DatabaseManager(DATABASE_URL)
\ No newline at end of file
@@ -1,28 +1,160 @@
 # project/utils/error_handler.py
 
 import discord
+import hashlib
 import logging
+import os
+import sysconfig
+import time
+import traceback
 import uuid
+from collections import OrderedDict
+
+from config.settings import (
+    ERROR_FINGERPRINT_LIMIT,
+    ERROR_REPLY_COOLDOWN,
+    ERROR_REPORT_RETENTION_DAYS,
+    ERROR_SAMPLE_INTERVAL,
+)
+from utils.data_manager import db_manager
+from utils import metrics
 
 logger = logging.getLogger(__name__)
 
+TRACEBACK_LIMIT = 8000  # Символов traceback, сохраняемых в БД
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STDLIB_ROOT = os.path.abspath(sysconfig.get_paths()['stdlib'])
+
+
+class ErrorStats:
+    """Счётчики одной ошибки: всего повторов, повторов с последней записи в лог и ID текущего окна по серверам."""
+    __slots__ = ('count', 'suppressed', 'ids', 'sampled_at')
+
+    def __init__(self):
+        self.count = 0
+        self.suppressed = 0
+        self.ids = {}  # {guild_id: error_id} - у каждого сервера свой ID, чтобы /ошибка показала его запись
+        self.sampled_at = float('-inf')
+
+
+def _is_project_file(filename: str) -> bool:
+    """
+    Файл кода бота, а не установленных пакетов или стандартной библиотеки.
+    venv лежит в корне проекта (sys.prefix == PROJECT_ROOT), поэтому сравнивать с sys.prefix нельзя:
+    пакеты отсекает site-packages, стандартную библиотеку - её путь из sysconfig.
+    """
+    path = os.path.abspath(filename)
+    return path.startswith(PROJECT_ROOT + os.sep) and 'site-packages' not in path and not path.startswith(STDLIB_ROOT + os.sep)
+
+
+def fingerprint(error: Exception, context: str = '') -> str:
+    """
+    Отпечаток ошибки: тип, место возникновения в коде бота и контекст.
+    Берётся последний кадр traceback из файлов проекта: ошибки discord.py (Forbidden, NotFound)
+    возникают внутри библиотеки, и по её кадру ошибки разных команд были бы неразличимы.
+    """
+    error = getattr(error, 'original', None) or error  # CommandInvokeError оборачивает исходную ошибку
+    frames = traceback.extract_tb(error.__traceback__)
+    own = [frame for frame in frames if _is_project_file(frame.filename)] or frames
+    site = f"{own[-1].filename}:{own[-1].lineno}" if own else ""
+    key = f"{type(error).__module__}.{type(error).__qualname__}|{site}|{context}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
 class BotErrorHandler:
-    """Централизованный класс для обработки ошибок."""
+    """
+    Централизованный класс для обработки ошибок.
+    Одинаковые ошибки (см. fingerprint) считаются в ограниченной таблице: полный traceback пишется
+    в лог не чаще раза в ERROR_SAMPLE_INTERVAL. Повторы в этом окне получают ID, уже выданный
+    их серверу; первый повтор на другом сервере получает свой ID и свою запись в БД без записи в лог.
+    """
+    stats = OrderedDict()  # {fingerprint: ErrorStats}, порядок - от давно встречавшихся к недавним
+    replied = {}           # {user_id: время последнего сообщения об ошибке}
+
+    @classmethod
+    def record(cls, error: Exception, context: str, guild_id: int = None, user_id: int = None):
+        """Учитывает ошибку. Возвращает (ID ошибки, ErrorStats), при необходимости пишет лог и запись в БД."""
+        key = fingerprint(error, context)
+        entry = cls.stats.get(key)
+        if entry is None:
+            entry = cls.stats[key] = ErrorStats()
+            if len(cls.stats) > ERROR_FINGERPRINT_LIMIT:
+                cls.stats.popitem(last=False)
+        else:
+            cls.stats.move_to_end(key)
+        entry.count += 1
+
+        now = time.monotonic()
+        if now - entry.sampled_at < ERROR_SAMPLE_INTERVAL:
+            entry.suppressed += 1
+            metrics.errors.inc(logged='no')
+            error_id = entry.ids.get(guild_id)
+            if error_id is None:
+                error_id = entry.ids[guild_id] = str(uuid.uuid4())[:8]
+                cls.store(error_id, key, error, context, guild_id, user_id)
+            return error_id, entry
+
+        error_id = str(uuid.uuid4())[:8]
+        repeats = f". Повторов с прошлой записи: {entry.suppressed}" if entry.suppressed else ""
+        entry.ids, entry.sampled_at, entry.suppressed = {guild_id: error_id}, now, 0
+        metrics.errors.inc(logged='yes')
+        logger.error(
+            f"[Error ID: {error_id}] Контекст: '{context}'. Ошибка: {error}{repeats}",
+            exc_info=error, extra={'error_id': error_id, 'guild_id': guild_id}
+        )
+        cls.store(error_id, key, error, context, guild_id, user_id)
+        return error_id, entry
+
     @staticmethod
-    async def handle(error: Exception, context: str, interaction: discord.Interaction = None):
+    def store(error_id: str, key: str, error: Exception, context: str, guild_id: int = None, user_id: int = None):
+        """Сохраняет ошибку в БД для поиска по ID через /ошибка."""
+        try:
+            db_manager.add_error_report(
+                error_id, key, context, type(error).__name__, str(error),
+                traceback=''.join(traceback.format_exception(type(error), error, error.__traceback__))[-TRACEBACK_LIMIT:],
+                guild_id=guild_id, user_id=user_id, retention_days=ERROR_REPORT_RETENTION_DAYS,
+            )
+        except Exception:
+            logger.exception(f"Не удалось сохранить ошибку {error_id} в БД.", extra={'error_id': error_id})
+
+    @classmethod
+    def may_reply(cls, user_id: int) -> bool:
+        """Не чаще одного сообщения об ошибке пользователю за ERROR_REPLY_COOLDOWN."""
+        now = time.monotonic()
+        if now - cls.replied.get(user_id, float('-inf')) < ERROR_REPLY_COOLDOWN:
+            return False
+        if len(cls.replied) >= ERROR_FINGERPRINT_LIMIT:
+            # Таблица не растёт бесконечно: истёкшие записи больше ничего не ограничивают
+            cls.replied = {uid: at for uid, at in cls.replied.items() if now - at < ERROR_REPLY_COOLDOWN}
+        cls.replied[user_id] = now
+        return True
+
+    @classmethod
+    async def handle(cls, error: Exception, context: str, interaction: discord.Interaction = None):
         """
         Логирует ошибку и отправляет пользователю сообщение.
+        Сверх лимита ERROR_REPLY_COOLDOWN отложенная (defer) команда получает короткий ответ без ID,
+        а не отложенная остаётся без ответа.
         """
-        error_id = str(uuid.uuid4())[:8]
-        logger.error(f"[Error ID: {error_id}] Контекст: '{context}'. Ошибка: {error}", exc_info=True)
-        
-        user_message = f"Произошла непредвиденная ошибка (ID: `{error_id}`). Администратор уже уведомлен."
-        
-        if interaction:
-            try:
-                if interaction.response.is_done():
-                    await interaction.followup.send(user_message, ephemeral=True)
-                else:
-                    await interaction.response.send_message(user_message, ephemeral=True)
-            except discord.HTTPException:
-                logger.error(f"Не удалось отправить сообщение об ошибке {error_id} пользователю.")
\ No newline at end of file
+        guild_id = interaction.guild_id if interaction else None
+        user_id = interaction.user.id if interaction else None
+        error_id, _ = cls.record(error, context, guild_id, user_id)
+
+        if not interaction:
+            return
+        if cls.may_reply(user_id):
+            user_message = f"Произошла непредвиденная ошибка (ID: `{error_id}`). Администратор уже уведомлен."
+        elif interaction.response.is_done():
+            # После defer без ответа команда осталась бы в состоянии "думает..." до истечения токена
+            user_message = "Произошла ошибка. Попробуйте позже."
+        else:
+            return
+
+        try:
+            if interaction.response.is_done():
+                await interaction.followup.send(user_message, ephemeral=True)
+            else:
+                await interaction.response.send_message(user_message, ephemeral=True)
+        except discord.HTTPException:
+            logger.error(f"Не удалось отправить сообщение об ошибке {error_id} пользователю.", extra={'error_id': error_id})
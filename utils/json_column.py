@@ -0,0 +1,79 @@
+# project/utils/json_column.py
+
+import json
+import zlib
+
+from sqlalchemy.types import JSON, LargeBinary, TypeDecorator
+
+from config.settings import JSON_COMPRESS_THRESHOLD
+
+# Быстрые кодеки необязательны: orjson, затем msgspec, иначе стандартный json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+COMPRESSED_PREFIX = b'\x00z'  # JSON не может начинаться с нулевого байта
+ZLIB_LEVEL = 3
+
+
+def _select_codec():
+    if orjson is not None:
+        return 'orjson', orjson.dumps, orjson.loads
+    if msgspec is not None:
+        return 'msgspec', msgspec.json.Encoder().encode, msgspec.json.Decoder().decode
+
+    def dumps(value) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return 'json', dumps, json.loads
+
+
+CODEC, dumps, loads = _select_codec()
+
+
+def encode(value, compress_threshold: int = JSON_COMPRESS_THRESHOLD) -> bytes:
+    """Кодирует значение в JSON; результат длиннее порога сжимается zlib (0 - без сжатия)."""
+    data = dumps(value)
+    if compress_threshold and len(data) > compress_threshold:
+        return COMPRESSED_PREFIX + zlib.compress(data, ZLIB_LEVEL)
+    return data
+
+
+def decode(data):
+    """Декодирует значение, записанное encode или стандартным типом JSON (строка)."""
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    if isinstance(data, bytes) and data.startswith(COMPRESSED_PREFIX):
+        data = zlib.decompress(data[len(COMPRESSED_PREFIX):])
+    return loads(data)
+
+
+class CompactJSON(TypeDecorator):
+    """
+    JSON-столбец с быстрым кодеком и сжатием больших значений.
+    В SQLite хранится как BLOB; строки, записанные раньше типом JSON как TEXT,
+    читаются без миграции и перезаписываются в новом формате при следующем обновлении.
+    В остальных СУБД ведёт себя как обычный JSON, чтобы не менять тип существующего столбца.
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'sqlite':
+            return dialect.type_descriptor(LargeBinary())
+        return dialect.type_descriptor(JSON())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != 'sqlite':
+            return value
+        return encode(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None or dialect.name != 'sqlite':
+            return value
+        return decode(value)
@@ -0,0 +1,166 @@
+# project/utils/list_index.py
+
+import bisect
+from collections import defaultdict
+
+
+class PrefixIndex:
+    """Отсортированные ключи (key, message_id) одного сервера; поиск по префиксу - бинарный."""
+    __slots__ = ('entries',)
+
+    def __init__(self):
+        self.entries = []
+
+    def add(self, key: str, message_id: int):
+        bisect.insort(self.entries, (key, message_id))
+
+    def remove(self, key: str, message_id: int):
+        position = bisect.bisect_left(self.entries, (key, message_id))
+        if position < len(self.entries) and self.entries[position] == (key, message_id):
+            del self.entries[position]
+
+    def search(self, prefix: str):
+        """ID списков, у которых ключ начинается с prefix, в порядке ключей."""
+        position = bisect.bisect_left(self.entries, (prefix,))
+        while position < len(self.entries):
+            key, message_id = self.entries[position]
+            if not key.startswith(prefix):
+                break
+            yield message_id
+            position += 1
+
+
+class ListSummary:
+    """Всё о списке, кроме состава: для ответов на команды без обращения к БД."""
+    __slots__ = ('message_id', 'guild_id', 'channel_id', 'title', 'sections', 'created_at', 'updated_at')
+
+    def __init__(self, db_list):
+        for name in self.__slots__:
+            setattr(self, name, getattr(db_list, name))
+
+
+class ListIndex:
+    """
+    Обратные индексы списков состава: роль, канал и сервер -> списки,
+    поиск списков сервера по началу названия или ID для автодополнения
+    и сводки списков (ListSummary) для команд только на чтение.
+    По событию роли, канала или сервера находит затронутые списки без чтения всех списков из БД.
+    """
+    def __init__(self):
+        self._guilds = {}                    # {guild_id: {message_id: frozenset(role_id, ...)}}
+        self._guild_of = {}                  # {message_id: guild_id}
+        self._summaries = {}                 # {message_id: ListSummary}
+        self._by_role = defaultdict(set)     # {role_id: {message_id, ...}}
+        self._by_channel = defaultdict(set)  # {channel_id: {message_id, ...}}
+        self._prefixes = defaultdict(PrefixIndex)  # {guild_id: PrefixIndex} - по названию и по ID
+
+    def set_guild(self, guild_id: int, lists):
+        """Заменяет индекс сервера списками из БД."""
+        self.drop_guild(guild_id)
+        self._guilds[guild_id] = {}
+        for db_list in lists:
+            self.add(db_list)
+
+    def drop_guild(self, guild_id: int):
+        for message_id in list(self._guilds.get(guild_id, ())):
+            self.remove(message_id)
+        self._guilds.pop(guild_id, None)
+        self._prefixes.pop(guild_id, None)
+
+    def add(self, db_list):
+        """
+        Добавляет список или обновляет его роли и сводку.
+        Списки сервера, ещё не загруженного через set_guild, пропускаются: иначе частичный индекс
+        сочли бы полным (is_indexed), а set_guild всё равно прочитает их из БД.
+        """
+        if db_list.guild_id not in self._guilds:
+            return
+        self.remove(db_list.message_id)
+        role_ids = frozenset(int(role_id) for role_id in db_list.sections)
+        self._guilds[db_list.guild_id][db_list.message_id] = role_ids
+        self._guild_of[db_list.message_id] = db_list.guild_id
+        self._summaries[db_list.message_id] = ListSummary(db_list)
+        self._by_channel[db_list.channel_id].add(db_list.message_id)
+        for key in self._search_keys(db_list.message_id, db_list.title):
+            self._prefixes[db_list.guild_id].add(key, db_list.message_id)
+        for role_id in role_ids:
+            self._by_role[role_id].add(db_list.message_id)
+
+    def remove(self, message_id: int) -> bool:
+        guild_id = self._guild_of.pop(message_id, None)
+        if guild_id is None:
+            return False
+        summary = self._summaries.pop(message_id)
+        self._discard(self._by_channel, summary.channel_id, message_id)
+        for key in self._search_keys(message_id, summary.title):
+            self._prefixes[guild_id].remove(key, message_id)
+        for role_id in self._guilds[guild_id].pop(message_id):
+            self._discard(self._by_role, role_id, message_id)
+        return True
+
+    @staticmethod
+    def _search_keys(message_id: int, title: str):
+        return (title.casefold(), str(message_id))
+
+    @staticmethod
+    def _discard(index: dict, key: int, message_id: int):
+        lists = index[key]
+        lists.discard(message_id)
+        if not lists:
+            del index[key]
+
+    def __contains__(self, message_id: int) -> bool:
+        return message_id in self._guild_of
+
+    def is_indexed(self, guild_id: int) -> bool:
+        return guild_id in self._guilds
+
+    def guild_of(self, message_id: int):
+        return self._guild_of.get(message_id)
+
+    def summary(self, message_id: int):
+        return self._summaries.get(message_id)
+
+    def touch(self, message_id: int, updated_at):
+        """Отмечает изменение состава списка, не трогая остальные индексы."""
+        summary = self._summaries.get(message_id)
+        if summary is not None:
+            summary.updated_at = updated_at
+
+    def page(self, guild_id: int, limit: int, after: int = 0, before: int = None):
+        """То же, что DatabaseManager.get_list_page, но по сводкам в памяти."""
+        message_ids = sorted(self._guilds.get(guild_id, ()))
+        if before is not None:
+            end = bisect.bisect_left(message_ids, before)
+            selected = message_ids[max(end - limit, 0):end]
+            has_more = end > limit
+        else:
+            start = bisect.bisect_right(message_ids, after)
+            selected = message_ids[start:start + limit]
+            has_more = start + limit < len(message_ids)
+        return [self._summaries[message_id] for message_id in selected], has_more
+
+    def search(self, guild_id: int, prefix: str, limit: int = 25) -> list:
+        """[(message_id, title), ...] списков сервера, чьё название или ID начинается с prefix."""
+        prefixes = self._prefixes.get(guild_id)
+        if prefixes is None:
+            return []
+        found = {}
+        for message_id in prefixes.search(prefix.strip().casefold()):
+            found.setdefault(message_id, self._summaries[message_id].title)
+            if len(found) >= limit:
+                break
+        return list(found.items())
+
+    def lists_for_role(self, role_id: int) -> frozenset:
+        return frozenset(self._by_role.get(int(role_id), ()))
+
+    def lists_for_channel(self, channel_id: int) -> frozenset:
+        return frozenset(self._by_channel.get(channel_id, ()))
+
+    def lists_for_guild(self, guild_id: int) -> frozenset:
+        return frozenset(self._guilds.get(guild_id, ()))
+
+    def roles_for_guild(self, guild_id: int) -> set:
+        """Все роли, которые отслеживаются хотя бы одним списком сервера."""
+        return set().union(*self._guilds.get(guild_id, {}).values())
@@ -0,0 +1,75 @@
+# project/utils/logging_setup.py
+
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+# Поля, которые вызывающий код передаёт через extra= и которые попадают в JSON отдельными ключами
+CONTEXT_FIELDS = ('guild_id', 'list_id', 'error_id')
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который ничего не форматирует в вызывающем потоке.
+    Стандартный prepare() форматирует запись, включая traceback, прямо на event loop;
+    здесь подставляются только аргументы сообщения, а traceback форматирует поток QueueListener.
+    """
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON: время, уровень, логгер, сообщение, поля контекста и traceback."""
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level='INFO', fmt='text', file_path=None, max_bytes=10 * 1024 * 1024, backup_count=5):
+    """
+    Направляет все логи через очередь: логгеры на event loop только кладут запись в очередь,
+    а форматирование и запись в stderr и файл (с ротацией по размеру) выполняет фоновый поток.
+    fmt - 'text' или 'json'. Возвращает запущенный QueueListener; его нужно остановить при выходе,
+    чтобы дописать оставшиеся записи.
+    """
+    formatter = JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT)
+
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if file_path:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            file_path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,91 @@
+# project/utils/loop_monitor.py
+
+import asyncio
+import logging
+import time
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """
+    Замеряет задержку планирования event loop.
+    Раз в interval секунд засыпает и сравнивает фактическое время пробуждения с ожидаемым.
+    """
+    def __init__(self, interval: float, warn_threshold: float):
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(), name='loop-lag-monitor')
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            metrics.loop_lag.observe(lag)
+            if lag >= self.warn_threshold:
+                logger.warning(f"Event loop отстаёт на {lag * 1000:.0f} мс.")
+
+
+class SlowCallbackTracer:
+    """
+    Логирует шаги event loop дольше threshold секунд вместе с корутиной и её стеком.
+    Оборачивает asyncio.Handle._run: накладные расходы - два вызова perf_counter на шаг.
+    """
+    def __init__(self, threshold: float, stack_limit: int = 10):
+        self.threshold = threshold
+        self.stack_limit = stack_limit
+        self._original_run = None
+
+    def install(self):
+        if self._original_run is not None:
+            return
+        original_run = self._original_run = asyncio.events.Handle._run
+        tracer = self
+
+        def _run(handle):
+            start = time.perf_counter()
+            try:
+                return original_run(handle)
+            finally:
+                duration = time.perf_counter() - start
+                if duration >= tracer.threshold:
+                    tracer.report(handle, duration)
+
+        asyncio.events.Handle._run = _run
+
+    def uninstall(self):
+        if self._original_run is not None:
+            asyncio.events.Handle._run = self._original_run
+            self._original_run = None
+
+    def report(self, handle, duration: float):
+        metrics.slow_callbacks.inc()
+        # Для шагов задачи колбэк привязан к самой задаче (Task.__step / task_wakeup)
+        task = getattr(handle._callback, '__self__', None)
+        if not isinstance(task, asyncio.Task):
+            logger.warning(f"Медленный колбэк event loop ({duration * 1000:.0f} мс): {handle!r}")
+            return
+
+        coro = task.get_coro()
+        name = getattr(coro, '__qualname__', repr(coro))
+        stack = "\n".join(
+            f"  {frame.f_code.co_filename}:{frame.f_lineno} в {frame.f_code.co_name}"
+            for frame in task.get_stack(limit=self.stack_limit)
+        )
+        logger.warning(
+            f"Медленный шаг задачи '{task.get_name()}' ({name}) - {duration * 1000:.0f} мс.\n"
+            f"Стек после шага:\n{stack or '  (задача завершена)'}"
+        )
@@ -0,0 +1,202 @@
+# project/utils/metrics.py
+
+import logging
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value) -> str:
+    if value != value:
+        return 'NaN'
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    """Базовый класс метрики с набором меток."""
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # {(label_value, ...): value}
+
+    def _key(self, labels) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получено {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        self._values.clear()
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield self.name, _format_labels(self.labelnames, key), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def remove(self, **labels):
+        self._values.pop(self._key(labels), None)
+
+    def set_function(self, function):
+        """Значение вычисляется функцией в момент сбора (только для метрик без меток)."""
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            yield self.name, '', self._function()
+            return
+        yield from super().samples()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # [счётчики по корзинам..., сумма, количество]
+            state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        state[-2] += value
+        state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        for key, state in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, key, ('le', _format_value(bound))), cumulative
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum", labels, state[-2]
+            yield f"{self.name}_count", labels, state[-1]
+
+
+class MetricsRegistry:
+    """Реестр метрик бота в формате Prometheus."""
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self._metrics.values()) + '\n'
+
+
+# --- Метрики бота ---
+registry = MetricsRegistry()
+
+update_queue_depth = registry.gauge(
+    'composition_update_queue_depth', 'Участников в очереди пакетного обновления', ('guild_id',))
+member_updates = registry.counter(
+    'composition_member_updates_total', 'События изменения ролей участников', ('result',))
+batch_duration = registry.histogram(
+    'composition_batch_duration_seconds', 'Длительность одного цикла batch_processor')
+batch_interval = registry.gauge(
+    'composition_batch_interval_seconds', 'Текущее окно накопления изменений перед проходом batch_processor')
+list_edits = registry.counter(
+    'composition_list_edits_total', 'Перерисовки сообщений списков', ('result',))
+quarantined_lists = registry.gauge(
+    'composition_quarantined_lists', 'Списки в карантине после неудачных правок')
+db_query_duration = registry.histogram(
+    'db_query_duration_seconds', 'Время выполнения методов DatabaseManager', ('method',))
+rest_requests = registry.counter(
+    'discord_rest_requests_total', 'REST-запросы к Discord', ('route', 'status'))
+gateway_latency = registry.gauge(
+    'discord_gateway_latency_seconds', 'Задержка heartbeat шлюза Discord')
+loop_lag = registry.histogram(
+    'event_loop_lag_seconds', 'Задержка планирования event loop')
+errors = registry.counter(
+    'bot_errors_total', 'Ошибки, прошедшие через BotErrorHandler', ('logged',))
+slow_callbacks = registry.counter(
+    'event_loop_slow_callbacks_total', 'Шаги event loop дольше порога SLOW_CALLBACK_THRESHOLD')
+
+
+# --- HTTP-эндпоинт ---
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=registry.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Запускает /metrics на текущем event loop бота и возвращает runner для остановки."""
+    app = web.Application()
+    app.router.add_get('/metrics', _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
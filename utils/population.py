@@ -0,0 +1,77 @@
+# project/utils/population.py
+
+import asyncio
+import logging
+
+from config.settings import MEMBER_CACHE_ENABLED
+
+logger = logging.getLogger(__name__)
+
+
+def tracked_roles_by_position(guild, sections: dict) -> list:
+    """ID отслеживаемых ролей, отсортированные по актуальной позиции на сервере (сверху вниз)."""
+    positions = {}
+    for role_id, section_data in sections.items():
+        role = guild.get_role(int(role_id))
+        positions[int(role_id)] = role.position if role else section_data.get('position', 0)
+    return sorted(positions, key=positions.get, reverse=True)
+
+
+def build_roster(members, role_ids: list) -> dict:
+    """
+    Распределяет участников по секциям за один проход.
+    role_ids отсортированы по убыванию позиции - участник попадает в секцию первой найденной роли.
+    """
+    roster = {str(role_id): [] for role_id in role_ids}
+    for member in members:
+        for role_id in role_ids:
+            if member.get_role(role_id) is not None:
+                roster[str(role_id)].append(member.mention)
+                break
+    return roster
+
+
+def build_roster_from_index(role_ids: list, members_of) -> dict:
+    """
+    То же распределение, но по индексу ролей: обходятся только владельцы отслеживаемых ролей.
+    members_of(role_id) возвращает ID участников с этой ролью.
+    """
+    roster = {}
+    placed = set()
+    for role_id in role_ids:
+        holders = members_of(role_id)
+        roster[str(role_id)] = [f"<@{member_id}>" for member_id in holders if member_id not in placed]
+        placed.update(holders)
+    return roster
+
+
+async def load_members(guild) -> list:
+    """
+    Возвращает участников сервера из кеша.
+    Если кеш не заполнен, запрашивает участников чанками через шлюз.
+    При отключённом кеше участников (MEMBER_CACHE_ENABLED) загруженный снимок в кеш не попадает.
+    Без интента members discord.py отказывает и в chunk, и в fetch_members - ClientException
+    передаётся вызывающему коду.
+    """
+    if not guild.chunked:
+        return await guild.chunk(cache=MEMBER_CACHE_ENABLED)
+    return list(guild.members)
+
+
+async def populate_sections(guild, sections: dict, role_index=None) -> dict:
+    """
+    Строит current_users для нового списка по участникам, которые уже имеют отслеживаемые роли.
+    Если для сервера построен индекс ролей (RoleMemberIndex), проход идёт только по владельцам ролей.
+    """
+    role_ids = tracked_roles_by_position(guild, sections)
+    indexed = role_index is not None and role_index.is_built(guild.id)
+    # Владельцев новых ролей индекс берёт из кеша участников; без кеша нужен свежий снимок
+    if indexed and (guild.chunked or role_index.tracked_of(guild.id).issuperset(role_ids)):
+        role_index.set_tracked(guild, role_index.tracked_of(guild.id) | set(role_ids))
+        return build_roster_from_index(role_ids, lambda role_id: role_index.members_of(guild.id, role_id))
+
+    members = await load_members(guild)
+    if indexed:
+        role_index.set_tracked(guild, role_index.tracked_of(guild.id) | set(role_ids), members)
+    # Снимок участников уже сделан, поэтому проход можно выполнить вне event loop
+    return await asyncio.to_thread(build_roster, members, role_ids)
@@ -0,0 +1,114 @@
+# project/utils/raw_events.py
+
+import logging
+from collections import deque
+
+from discord.utils import maybe_coroutine
+
+logger = logging.getLogger(__name__)
+
+
+class RawMemberUpdateHook:
+    """
+    Перехватывает GUILD_MEMBER_UPDATE до разбора discord.py и передаёт в callback
+    только (guild_id, ID участника, ID ролей). Не зависит от кеша участников:
+    on_member_update для некешированных участников не вызывается вовсе, а для кешированных
+    требует построения двух объектов Member.
+    """
+    EVENT = 'GUILD_MEMBER_UPDATE'
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._parsers = None
+        self._original = None
+
+    @property
+    def installed(self) -> bool:
+        return self._parsers is not None
+
+    def install(self, connection):
+        """Подменяет парсер события в ConnectionState; штатный парсер вызывается после callback."""
+        if self.installed:
+            return
+        self._parsers = connection.parsers
+        self._original = original = self._parsers[self.EVENT]
+        callback = self.callback
+
+        def parse_guild_member_update(data):
+            try:
+                callback(int(data['guild_id']), int(data['user']['id']), data['roles'])
+            except Exception:
+                # Ошибка в обработчике не должна ломать разбор события discord.py
+                logger.exception("Ошибка при обработке raw GUILD_MEMBER_UPDATE")
+            original(data)
+
+        self._parsers[self.EVENT] = parse_guild_member_update
+
+    def uninstall(self):
+        if not self.installed:
+            return
+        self._parsers[self.EVENT] = self._original
+        self._parsers = None
+        self._original = None
+
+
+class EventHandoff:
+    """
+    Копит события кога, пока он перезагружается. discord.py снимает слушатели кога до вызова
+    cog_unload, а слушатели нового экземпляра подключает только после его cog_load - события
+    между этими моментами сохраняются здесь и передаются новому экземпляру по порядку.
+    Сверх limit событий буфер очищается и помечается overflowed: новый экземпляр
+    пересобирает индексы и списки серверов целиком.
+    """
+    def __init__(self, bot, cog, limit: int, raw_callback: str = None):
+        self.bot = bot
+        self.limit = limit
+        self.events = deque()  # [(имя метода кога, аргументы), ...]
+        self.overflowed = False
+        self.target = None
+        self._listeners = []
+        for name, method in cog.get_listeners():
+            recorder = self._recorder(method.__name__)
+            bot.add_listener(recorder, name)
+            self._listeners.append((name, recorder))
+        self.raw_hook = None
+        if raw_callback:
+            self.raw_hook = RawMemberUpdateHook(lambda *args: self.record(raw_callback, args))
+            self.raw_hook.install(bot._connection)
+
+    def record(self, method_name: str, args: tuple):
+        if self.overflowed:
+            return
+        if len(self.events) >= self.limit:
+            self.overflowed = True
+            self.events.clear()
+            logger.warning(f"Во время перезагрузки кога пришло больше {self.limit} событий, серверы будут пересобраны заново.")
+            return
+        self.events.append((method_name, args))
+
+    def _recorder(self, method_name: str):
+        async def record_event(*args):
+            if self.target is None:
+                self.record(method_name, args)
+            else:
+                # Событие разослано до передачи, а его задача выполняется уже после неё
+                await maybe_coroutine(getattr(self.target, method_name), *args)
+        return record_event
+
+    async def hand_over(self, cog):
+        """
+        Выполняет накопленные события обработчиками нового экземпляра и снимает перехват.
+        События, пришедшие во время выполнения, тоже попадают в буфер и выполняются следом.
+        После возврата вызывающий код должен без await подключить собственные обработчики.
+        """
+        while self.events:
+            method_name, args = self.events.popleft()
+            try:
+                await maybe_coroutine(getattr(cog, method_name), *args)
+            except Exception:
+                logger.exception(f"Ошибка при обработке события {method_name}, отложенного на время перезагрузки")
+        for name, recorder in self._listeners:
+            self.bot.remove_listener(recorder, name)
+        if self.raw_hook is not None:
+            self.raw_hook.uninstall()
+        self.target = cog
@@ -0,0 +1,89 @@
+# project/utils/recompute.py
+
+import itertools
+import logging
+
+from utils.population import build_roster, tracked_roles_by_position
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен: без него используется построчный проход build_roster
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+def _held_role_ids(member):
+    """ID ролей участника. discord.Member хранит их в SnowflakeList, прочие объекты - в roles."""
+    role_ids = getattr(member, '_roles', None)
+    return role_ids if role_ids is not None else [role.id for role in member.roles]
+
+
+def membership_matrix(members, role_ids: list):
+    """
+    Булева матрица участники × роли: matrix[i, j] - есть ли у members[i] роль role_ids[j].
+    Из Python читаются только ID ролей участников, сопоставление с ролями выполняется в NumPy.
+    Возвращает (массив ID участников, матрица).
+    """
+    member_ids = np.fromiter((member.id for member in members), dtype=np.int64, count=len(members))
+    held = [_held_role_ids(member) for member in members]
+    counts = np.fromiter((len(role_ids_) for role_ids_ in held), dtype=np.int64, count=len(held))
+    flat = np.fromiter(itertools.chain.from_iterable(held), dtype=np.int64, count=int(counts.sum()))
+    rows = np.repeat(np.arange(len(members)), counts)
+
+    columns = np.asarray(role_ids, dtype=np.int64)
+    order = np.argsort(columns)
+    sorted_columns = columns[order]
+    found = np.searchsorted(sorted_columns, flat).clip(max=len(columns) - 1)
+    tracked = sorted_columns[found] == flat
+
+    matrix = np.zeros((len(members), len(columns)), dtype=bool)
+    matrix[rows[tracked], order[found[tracked]]] = True
+    return member_ids, matrix
+
+
+def _roster_from_matrix(member_ids, matrix, role_ids: list) -> dict:
+    """Секция каждого участника - первый столбец с True (столбцы отсортированы по убыванию позиции)."""
+    has_role = matrix.any(axis=1)
+    section = np.where(has_role, matrix.argmax(axis=1), -1)
+    return {
+        str(role_id): tuple(f"<@{member_id}>" for member_id in member_ids[section == column].tolist())
+        for column, role_id in enumerate(role_ids)
+    }
+
+
+def recompute_rosters(guild, members, lists) -> dict:
+    """
+    Пересобирает current_users всех списков сервера с нуля по снимку участников.
+    Матрица строится один раз для объединения ролей всех списков; списки с одинаковым
+    набором ролей получают общий результат. Без NumPy используется build_roster.
+    Возвращает {message_id: current_users}; списки одной группы разделяют одни и те же кортежи.
+    """
+    sections = {}
+    groups = {}
+    for db_list in lists:
+        sections.update(db_list.sections)
+        groups.setdefault(frozenset(db_list.sections), []).append(db_list)
+    if not groups:
+        return {}
+
+    role_ids = tracked_roles_by_position(guild, sections)
+    use_matrix = np is not None and bool(role_ids)
+    if use_matrix:
+        member_ids, matrix = membership_matrix(members, role_ids)
+        column_of = {str(role_id): column for column, role_id in enumerate(role_ids)}
+
+    rosters = {}
+    for section_ids, group in groups.items():
+        group_role_ids = [role_id for role_id in role_ids if str(role_id) in section_ids]
+        if not group_role_ids:
+            # Все роли списка удалены: argmax по пустому набору столбцов не определён
+            roster = {}
+        elif use_matrix:
+            columns = [column_of[str(role_id)] for role_id in group_role_ids]
+            roster = _roster_from_matrix(member_ids, matrix[:, columns], group_role_ids)
+        else:
+            roster = {role_id: tuple(users) for role_id, users in build_roster(members, group_role_ids).items()}
+        for db_list in group:
+            rosters[db_list.message_id] = roster
+    return rosters
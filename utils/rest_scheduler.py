@@ -0,0 +1,196 @@
+# project/utils/rest_scheduler.py
+
+import asyncio
+import logging
+import re
+import statistics
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+from config.settings import REST_BACKGROUND_RESERVE, REST_BACKGROUND_MAX_DELAY, REST_INTERACTIVE_RESERVE
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Сегменты пути, после которых идёт "мажорный" параметр маршрута Discord.
+# Для них лимиты считаются отдельно, поэтому ID оставляем в ключе.
+_MAJOR_SEGMENTS = ('channels', 'guilds', 'webhooks')
+_API_PREFIX = re.compile(r'^/api(?:/v\d+)?')
+_SNOWFLAKE = re.compile(r'^\d{15,21}$')
+
+
+def route_key(method: str, path: str, major_ids: bool = True) -> str:
+    """
+    Нормализует путь запроса в ключ маршрута.
+    Мажорные параметры (channel/guild/webhook ID) сохраняются, остальные ID и токены заменяются шаблоном.
+    major_ids=False заменяет шаблоном и мажорные параметры ({channel_id} и т.п.) - для меток метрик,
+    число которых не должно расти с числом каналов.
+    """
+    parts = _API_PREFIX.sub('', path).strip('/').split('/')
+    normalized = []
+    for i, part in enumerate(parts):
+        previous = parts[i - 1] if i else None
+        if previous in _MAJOR_SEGMENTS:
+            normalized.append(part if major_ids or not _SNOWFLAKE.match(part) else f"{{{previous[:-1]}_id}}")
+        elif previous == 'interactions' or (i >= 2 and parts[i - 2] in ('webhooks', 'interactions')):
+            normalized.append('{token}' if not _SNOWFLAKE.match(part) else '{id}')
+        elif _SNOWFLAKE.match(part):
+            normalized.append('{id}')
+        else:
+            normalized.append(part)
+    return f"{method.upper()} /{'/'.join(normalized)}"
+
+
+def message_route(method: str, channel_id: int) -> str:
+    """Ключ маршрута для операций с конкретным сообщением в канале."""
+    return f"{method.upper()} /channels/{channel_id}/messages/{{id}}"
+
+
+class RequestShed(Exception):
+    """Фоновый запрос отброшен: бюджет маршрута не восстановится в допустимое время."""
+    def __init__(self, route: str, delay: float):
+        super().__init__(f"Запрос к '{route}' отброшен (ожидание {delay:.1f} с)")
+        self.route = route
+        self.delay = delay
+
+
+class RouteBudget:
+    """Остаток лимита маршрута по данным из заголовков ответа."""
+    __slots__ = ('limit', 'remaining', 'reset_at')
+
+    def __init__(self, limit: int, remaining: int, reset_at: float):
+        self.limit = limit
+        self.remaining = remaining
+        self.reset_at = reset_at
+
+
+class RestScheduler:
+    """
+    Приоритетный планировщик REST-запросов бота.
+    Интерактивные ответы выполняются сразу. Фоновые правки и удаления не трогают запас
+    каждого маршрута (reserve, а пока идут команды - reserve + interactive_reserve)
+    и ждут только сброса лимита своего маршрута, а не завершения команд.
+    """
+    def __init__(self, reserve: int = REST_BACKGROUND_RESERVE, max_delay: float = REST_BACKGROUND_MAX_DELAY,
+                 interactive_reserve: int = REST_INTERACTIVE_RESERVE):
+        self.reserve = reserve
+        self.interactive_reserve = interactive_reserve
+        self.max_delay = max_delay
+        self.budgets = {}  # {route_key: RouteBudget}
+        self._global_reset_at = 0.0
+        self._interactive = 0
+
+    # --- Учёт лимитов по заголовкам ---
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """Возвращает TraceConfig для HTTP-клиента discord.py (параметр http_trace)."""
+        trace = aiohttp.TraceConfig()
+        trace.on_request_end.append(self._on_request_end)
+        return trace
+
+    async def _on_request_end(self, session, context, params: aiohttp.TraceRequestEndParams):
+        self.observe(params.method, params.url.path, params.response.status, params.response.headers)
+        metrics.rest_requests.inc(route=route_key(params.method, params.url.path, major_ids=False), status=params.response.status)
+
+    def observe(self, method: str, path: str, status: int, headers) -> str:
+        """Обновляет бюджет маршрута по заголовкам X-RateLimit-* и возвращает ключ маршрута."""
+        route = route_key(method, path)
+        now = asyncio.get_running_loop().time()
+
+        if status == 429:
+            retry_after = float(headers.get('Retry-After', 0) or 0)
+            if headers.get('X-RateLimit-Global') or headers.get('X-RateLimit-Scope') == 'global':
+                self._global_reset_at = max(self._global_reset_at, now + retry_after)
+                logger.warning(f"Достигнут глобальный лимит REST, пауза {retry_after:.2f} с.")
+                return route
+            budget = self.budgets.get(route)
+            if budget is None:
+                self.budgets[route] = RouteBudget(1, 0, now + retry_after)
+            else:
+                budget.remaining = 0
+                budget.reset_at = now + retry_after
+            return route
+
+        remaining = headers.get('X-RateLimit-Remaining')
+        if remaining is None:
+            return route
+
+        limit = int(headers.get('X-RateLimit-Limit', 1))
+        reset_at = now + float(headers.get('X-RateLimit-Reset-After', 0) or 0)
+        budget = self.budgets.get(route)
+        if budget is None:
+            self.budgets[route] = RouteBudget(limit, int(remaining), reset_at)
+        else:
+            budget.limit = limit
+            budget.remaining = int(remaining)
+            budget.reset_at = reset_at
+        return route
+
+    def delay_for(self, route: str) -> float:
+        """Сколько секунд фоновый запрос к маршруту должен подождать, чтобы не съесть запас интерактивных."""
+        now = asyncio.get_running_loop().time()
+        if now < self._global_reset_at:
+            return self._global_reset_at - now
+
+        budget = self.budgets.get(route)
+        if budget is None or now >= budget.reset_at:
+            return 0.0
+        reserve = self.reserve + (self.interactive_reserve if self._interactive else 0)
+        if budget.remaining > reserve:
+            return 0.0
+        return budget.reset_at - now
+
+    def headroom(self, routes) -> float:
+        """
+        Медиана оставшейся доли лимита (0..1) по маршрутам routes: один исчерпанный канал
+        не должен тянуть за собой оценку для остальных. Маршруты без сведений или с уже
+        сброшенным лимитом считаются полными; при глобальном лимите - 0.
+        """
+        now = asyncio.get_running_loop().time()
+        if now < self._global_reset_at:
+            return 0.0
+        fractions = []
+        for route in routes:
+            budget = self.budgets.get(route)
+            if budget is None or now >= budget.reset_at or budget.limit <= 0:
+                fractions.append(1.0)
+            else:
+                fractions.append(budget.remaining / budget.limit)
+        return statistics.median(fractions) if fractions else 1.0
+
+    # --- Приоритеты ---
+    @asynccontextmanager
+    async def interactive(self):
+        """
+        Помечает выполнение интерактивной команды: пока она идёт, фоновые запросы оставляют
+        на каждом маршруте увеличенный запас. Фоновые запросы команду не ждут, поэтому команда
+        может сама запускать фоновые правки.
+        """
+        self._interactive += 1
+        try:
+            yield
+        finally:
+            self._interactive -= 1
+
+    async def background(self, route: str, request):
+        """
+        Выполняет фоновый запрос request() с низким приоритетом.
+        Бросает RequestShed, если бюджет маршрута не освободится за max_delay секунд.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_delay
+
+        while True:
+            delay = self.delay_for(route)
+            if delay <= 0:
+                break
+            if loop.time() + delay > deadline:
+                raise RequestShed(route, delay)
+            await asyncio.sleep(delay)
+
+        # Резервируем единицу бюджета до прихода новых заголовков
+        budget = self.budgets.get(route)
+        if budget is not None and budget.remaining > 0:
+            budget.remaining -= 1
+
+        return await request()
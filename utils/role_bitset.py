@@ -0,0 +1,38 @@
+# project/utils/role_bitset.py
+
+
+class RoleBitset:
+    """
+    Скомпилированное представление отслеживаемых ролей сервера.
+    Каждой роли соответствует бит; чем выше роль на сервере, тем старше бит.
+    Наивысшая роль участника в списке - старший бит в (маска участника & маска списка).
+    """
+    __slots__ = ('bit_of', 'role_ids')
+
+    def __init__(self, ordered_role_ids):
+        self.role_ids = tuple(ordered_role_ids)  # role_ids[bit] - роль этого бита
+        self.bit_of = {role_id: bit for bit, role_id in enumerate(self.role_ids)}
+
+    @classmethod
+    def compile(cls, guild, tracked_role_ids):
+        """Упорядочивает роли по актуальной позиции. Удалённые с сервера роли бит не получают."""
+        roles = [guild.get_role(int(role_id)) for role_id in set(tracked_role_ids)]
+        # При равных позициях Discord выше ставит роль с меньшим ID
+        ordered = sorted((role for role in roles if role is not None), key=lambda role: (role.position, -role.id))
+        return cls(role.id for role in ordered)
+
+    def mask_for(self, role_ids) -> int:
+        """Маска для набора ID ролей (int или str); неотслеживаемые роли пропускаются."""
+        mask = 0
+        bit_of = self.bit_of
+        for role_id in role_ids:
+            bit = bit_of.get(int(role_id))
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def highest(self, mask: int):
+        """ID наивысшей роли в маске или None для пустой маски."""
+        if not mask:
+            return None
+        return self.role_ids[mask.bit_length() - 1]
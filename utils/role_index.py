@@ -0,0 +1,132 @@
+# project/utils/role_index.py
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class GuildRoleIndex:
+    """Индекс одного сервера: отслеживаемая роль -> участники и обратная связь участник -> роли."""
+    __slots__ = ('tracked', 'members', 'member_roles')
+
+    def __init__(self):
+        self.tracked = frozenset()
+        self.members = {}       # {role_id: {member_id, ...}}
+        self.member_roles = {}  # {member_id: frozenset(role_id, ...)} - только отслеживаемые роли
+
+    def _set_member(self, member_id: int, held: frozenset):
+        previous = self.member_roles.get(member_id, frozenset())
+        if held == previous:
+            return False
+        for role_id in previous - held:
+            self.members[role_id].discard(member_id)
+        for role_id in held - previous:
+            self.members[role_id].add(member_id)
+        if held:
+            self.member_roles[member_id] = held
+        else:
+            self.member_roles.pop(member_id, None)
+        return True
+
+
+class RoleMemberIndex:
+    """
+    Инкрементально поддерживаемый индекс отслеживаемых ролей по серверам.
+    Строится один раз при загрузке участников сервера и обновляется событиями участников,
+    поэтому выборка владельцев роли стоит O(размер роли), а не O(размер сервера).
+    """
+    def __init__(self):
+        self._guilds = {}  # {guild_id: GuildRoleIndex}
+
+    def is_built(self, guild_id: int) -> bool:
+        return guild_id in self._guilds
+
+    def build(self, guild, tracked_role_ids, members=None):
+        """Строит индекс сервера одним проходом по кешу участников или по переданному снимку members."""
+        index = GuildRoleIndex()
+        index.tracked = frozenset(int(role_id) for role_id in tracked_role_ids)
+        index.members = {role_id: set() for role_id in index.tracked}
+        for member in (guild.members if members is None else members):
+            held = frozenset(role_id for role_id in index.tracked if member.get_role(role_id) is not None)
+            if held:
+                index._set_member(member.id, held)
+        self._guilds[guild.id] = index
+        logger.info(f"Индекс ролей сервера {guild.id} построен: {len(index.tracked)} ролей, {len(index.member_roles)} участников.")
+        return index
+
+    def export_state(self) -> dict:
+        """Снимок индекса из встроенных типов: {guild_id: (отслеживаемые роли, {member_id: роли})}."""
+        return {guild_id: (index.tracked, dict(index.member_roles)) for guild_id, index in self._guilds.items()}
+
+    def load_state(self, state: dict):
+        """Восстанавливает серверы из export_state() без обхода участников."""
+        for guild_id, (tracked, member_roles) in state.items():
+            index = GuildRoleIndex()
+            index.tracked = frozenset(tracked)
+            index.members = {role_id: set() for role_id in index.tracked}
+            for member_id, held in member_roles.items():
+                index._set_member(member_id, frozenset(held) & index.tracked)
+            self._guilds[guild_id] = index
+
+    def drop(self, guild_id: int):
+        self._guilds.pop(guild_id, None)
+
+    def set_tracked(self, guild, tracked_role_ids, members=None):
+        """
+        Меняет набор отслеживаемых ролей. Владельцы новых ролей берутся из кеша сервера,
+        а если кеш участников отключён - из переданного снимка members.
+        """
+        index = self._guilds.get(guild.id)
+        if index is None:
+            return
+        tracked = frozenset(int(role_id) for role_id in tracked_role_ids)
+        for role_id in index.tracked - tracked:
+            for member_id in list(index.members[role_id]):
+                index._set_member(member_id, index.member_roles[member_id] - {role_id})
+            del index.members[role_id]
+        added = tracked - index.tracked
+        index.tracked = tracked
+        for role_id in added:
+            index.members[role_id] = set()
+        if members is not None:
+            for member in members:
+                held = frozenset(role_id for role_id in added if member.get_role(role_id) is not None)
+                if held:
+                    index._set_member(member.id, index.member_roles.get(member.id, frozenset()) | held)
+        else:
+            for role_id in added:
+                role = guild.get_role(role_id)
+                for member in (role.members if role else ()):
+                    index._set_member(member.id, index.member_roles.get(member.id, frozenset()) | {role_id})
+
+    def update_member(self, guild_id: int, member_id: int, role_ids) -> bool:
+        """Обновляет роли участника по полному списку его ролей. Возвращает True, если отслеживаемые роли изменились."""
+        index = self._guilds.get(guild_id)
+        if index is None:
+            return False
+        held = index.tracked.intersection(map(int, role_ids))
+        return index._set_member(member_id, held)
+
+    def remove_member(self, guild_id: int, member_id: int) -> bool:
+        index = self._guilds.get(guild_id)
+        if index is None:
+            return False
+        return index._set_member(member_id, frozenset())
+
+    def tracked_of(self, guild_id: int) -> frozenset:
+        index = self._guilds.get(guild_id)
+        return index.tracked if index is not None else frozenset()
+
+    def members_of(self, guild_id: int, role_id: int):
+        """Участники с ролью role_id (пустое множество, если роль не отслеживается)."""
+        index = self._guilds.get(guild_id)
+        if index is None:
+            return frozenset()
+        return index.members.get(int(role_id), frozenset())
+
+    def roles_of(self, guild_id: int, member_id: int) -> frozenset:
+        """Отслеживаемые роли участника."""
+        index = self._guilds.get(guild_id)
+        if index is None:
+            return frozenset()
+        return index.member_roles.get(member_id, frozenset())